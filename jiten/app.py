@@ -119,6 +119,48 @@ True
 >>> "きっかけ、キッカケ、切っ掛け、切掛け、切っかけ、切掛、切っ掛、切かけ" in d
 True
 
+>>> r = client.get("/jmdict/by-jlpt/2")
+>>> etag = r.headers["ETag"]
+>>> h = {"If-None-Match": etag}
+>>> r = client.get("/jmdict/by-jlpt/2", headers = h)
+>>> r.status, r.data, r.headers["ETag"] == etag
+('304 NOT MODIFIED', b'', True)
+>>> st = os.stat(J.SQLITE_FILE)
+>>> os.utime(J.SQLITE_FILE, ns = (st.st_atime_ns, st.st_mtime_ns + 1))
+>>> r = client.get("/jmdict/by-jlpt/2", headers = h)
+>>> os.utime(J.SQLITE_FILE, ns = (st.st_atime_ns, st.st_mtime_ns))
+>>> r.status, r.headers["ETag"] == etag, len(r.data) > 0
+('200 OK', False, True)
+>>> client.get("/kanji/by-jlpt", headers = h).status
+'200 OK'
+
+>>> cc = lambda url: client.get(url).headers["Cache-Control"]
+>>> cc("/static/script.js?s=1"), cc("/static/privacy.txt")
+('public, max-age=31536000', 'no-cache')
+
+>>> import gzip
+>>> gz = {"Accept-Encoding": "gzip"}
+>>> r = client.get("/jmdict/by-jlpt/2", headers = gz)
+>>> r.is_streamed, r.headers["Content-Encoding"], r.headers["Vary"]
+(True, 'gzip', 'Cookie, Accept-Encoding')
+>>> "Content-Length" in r.headers
+False
+>>> r.headers["ETag"] == "W/" + etag
+True
+>>> d = gzip.decompress(r.data).decode()
+>>> d == client.get("/jmdict/by-jlpt/2").get_data(as_text = True)
+True
+>>> h = { **gz, "If-None-Match": r.headers["ETag"] }
+>>> client.get("/jmdict/by-jlpt/2", headers = h).status
+'304 NOT MODIFIED'
+>>> r = client.get("/jmdict?query=kitten", headers = gz)
+>>> d = gzip.decompress(r.data).decode()
+>>> r.headers["Content-Encoding"], "koꜛneꜜko" in d
+('gzip', True)
+>>> r = client.get("/jmdict?query=kitten")
+>>> "Content-Encoding" in r.headers, r.headers["Vary"]
+(False, 'Accept-Encoding')
+
 >>> d = get("/jmdict/by-jlpt/3")
 200 OK
 >>> "恐ろしい、怖ろしい" in d
@@ -149,6 +191,15 @@ True
 >>> d.index("JLPT N3") < d.index("歯", d.index("JLPT N5")) < d.index("JLPT N2")
 True
 
+>>> j = client.get("/_radicals?q=口木").get_json()
+>>> j == dict(zip("kanji count radicals".split(),
+...                K.radical_candidates("口木", MAX)))
+True
+>>> "呆" in j["kanji"] and "口" in j["radicals"], j["count"] > 0
+(True, True)
+>>> client.get("/_radicals").get_json()["kanji"]
+''
+
 >>> def cookies():
 ...   import importlib.metadata
 ...   v = tuple(map(int, importlib.metadata.version("werkzeug").split(".")))
@@ -169,7 +220,8 @@ True
 
 """                                                             # }}}1
 
-import json, os, sys, time
+import contextlib, functools, hashlib, itertools, json, os, shutil, sys
+import time, zlib
 
 from pathlib import Path
 
@@ -179,8 +231,14 @@ import click, flask, jinja2, werkzeug
 os.environ["FLASK_SKIP_DOTENV"] = "yes"                       #  FIXME
 from flask import Flask, abort, make_response, redirect, request, render_template, url_for
 
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
 from .version import __version__, py_version
 from .kana import kana2romaji
+from .sql import cache_ident, cache_stats
 
 from . import jmdict    as J
 from . import kanji     as K
@@ -194,11 +252,24 @@ NAME          = "jiten"
 HTTPS         = NAME.upper() + "_HTTPS"
 DOMAIN        = NAME.upper() + "_DOMAIN"
 PREFS         = "lang dark roma nor2h max large nogrid".split()
+STATIC_AGE    = 3600*24*365                                   # 1 year
+PAGES_DIR     = M.resource_path("res/pages")
+PAGES_PREFS   = "dark large roma".split()
+STREAM_BUF    = 64                                            # events
+COMPRESS_MIN  = 1024
+COMPRESS_MIME = "text/html application/json".split()
 
 GUI_TOKEN     = os.environ.get("JITEN_GUI_TOKEN") or None
 ANDROID_PRIV  = os.environ.get("ANDROID_PRIVATE") or None
 
-app           = Flask(__name__)
+# NB: only static URLs cache-busted w/ ?s=START get a long max-age;
+# other static files (e.g. fonts, icons) are revalidated
+class Jiten(Flask):
+  def get_send_file_max_age(self, filename):
+    if "s" in request.args: return STATIC_AGE
+    return super().get_send_file_max_age(filename)
+
+app           = Jiten(__name__)
 
 if GUI_TOKEN:
   CONF_PATH   = Path.home() / ".config" / "jiten"             #  FIXME
@@ -241,6 +312,44 @@ if os.environ.get(HTTPS) == "force":
     response.headers["Strict-Transport-Security"] = 'max-age=63072000'
     return response
 
+# NB: local (GUI/android) use doesn't need compression; streamed
+# responses are compressed (and flushed) chunk by chunk
+if not CONF_PREFS:
+  @app.after_request
+  def compress_response(response):
+    r = response
+    if r.status_code != 200 or r.direct_passthrough or \
+       "Content-Encoding" in r.headers or \
+       r.mimetype not in COMPRESS_MIME:
+      return r
+    r.vary.add("Accept-Encoding")
+    if not r.is_streamed and \
+       r.calculate_content_length() < COMPRESS_MIN:
+      return r
+    encs  = (["br"] if brotli else []) + ["gzip"]
+    if not (enc := request.accept_encodings.best_match(encs)): return r
+    etag, weak = r.get_etag()
+    if etag and not weak: r.set_etag(etag, weak = True)
+    r.headers["Content-Encoding"] = enc
+    if r.is_streamed:
+      r.response = compressed(r.iter_encoded(), enc)
+      r.headers.pop("Content-Length", None)
+    else:
+      r.set_data(b"".join(compressed([r.get_data()], enc, False)))
+    return r
+
+def compressed(chunks, enc, flush = True):
+  if enc == "br":
+    z = brotli.Compressor()
+    f, g, h = z.process, z.flush, z.finish
+  else:
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    f, g, h = z.compress, (lambda: z.flush(zlib.Z_SYNC_FLUSH)), z.flush
+  for chunk in chunks:
+    data = f(chunk) + (g() if flush else b"")
+    if data: yield data
+  yield h()
+
 if os.environ.get(DOMAIN):
   domain = os.environ.get(DOMAIN)
   @app.before_request
@@ -257,33 +366,164 @@ def arg_bool(k, *a, **kw):
 def yesno(b):
   return "yes" if b else "no"
 
-def respond(template, page_title, **data):
-  prefs       = get_prefs()
-  langs       = get_langs(prefs)
-  dark        = prefs.get("dark") == "yes"
-  roma        = prefs.get("roma") == "yes"
-  nor2h       = prefs.get("nor2h") == "yes"
-  large_jap   = prefs.get("large") == "yes"
-  nogrid      = prefs.get("nogrid") == "yes"
-  pref_langs  = prefs.get("lang", "").split() or [J.LANGS[0]]
-  pref_max    = int(prefs.get("max", MAX))
-  return make_response(render_template(
-    template, mode = "dark" if dark else "light", langs = langs,
-    roma = roma, nor2h = nor2h, large_jap = large_jap,
-    kanjidraw_nogrid = nogrid, pref_langs = pref_langs,
-    pref_max = pref_max, int = int, ord = ord, hex = hex, J = J,
-    K = K, M = M, P = P, S = S, START = START, VERSION = __version__,
+# NB: the context managers in using (e.g. DB connections) are entered
+# for the duration of the rendering, which is done progressively when
+# stream is set
+def respond(template, page_title, *, stream = False, using = {},
+            **data):
+  ctx = dict(
+    **page_prefs(get_prefs()), int = int, ord = ord,
+    hex = hex, J = J, K = K, M = M, P = P, S = S, START = START,
+    VERSION = __version__,
     PY_VERSION = py_version, kana2romaji = kana2romaji,
     SEARCH = SEARCH, GUI = bool(GUI_TOKEN), DESCRIPTION = DESCRIPTION,
     KEYWORDS = KEYWORDS, TITLE = TITLE, page_title = page_title,
     kanji_level_minmax = kanji_level_minmax, **data
-  ))
+  )
+  if stream:
+    return make_response(flask.stream_with_context(
+      stream_template(template, ctx, using)
+    ))
+  with contextlib.ExitStack() as s:
+    for k, f in using.items(): ctx[k] = s.enter_context(f())
+    return make_response(render_template(template, **ctx))
+
+def stream_template(template, ctx, using):
+  with contextlib.ExitStack() as s:
+    for k, f in using.items(): ctx[k] = s.enter_context(f())
+    app.update_template_context(ctx)
+    t = app.jinja_env.get_or_select_template(template).stream(ctx)
+    t.enable_buffering(STREAM_BUF)
+    yield from t
+
+# NB: starts the search (so e.g. a RegexError is raised) before the
+# response is streamed
+def prefetched(results):
+  it = iter(results)
+  return itertools.chain(list(itertools.islice(it, 1)), it)
+
+def page_prefs(prefs):
+  yes = lambda k: prefs.get(k) == "yes"
+  return dict(
+    mode = "dark" if yes("dark") else "light",
+    langs = get_langs(prefs), roma = yes("roma"), nor2h = yes("nor2h"),
+    large_jap = yes("large"), kanjidraw_nogrid = yes("nogrid"),
+    pref_langs = prefs.get("lang", "").split() or [J.LANGS[0]],
+    pref_max = int(prefs.get("max", MAX)),
+  )
+
+# NB: for pages that only depend on the db files, the args & the
+# prefs; returns 304 w/o rendering when the ETag matches (which
+# changes when a db file is replaced or updated in place)
+def cacheable(*files):
+  def decorator(f):
+    @functools.wraps(f)
+    def g(*a, **k):
+      prefs = sorted(get_prefs().items())
+      dbs   = [ cache_ident(x) for x in files ]
+      key   = (J.DBVERSION, START, __version__, request.full_path,
+               prefs, dbs)
+      etag  = hashlib.sha1(repr(key).encode()).hexdigest()
+      if request.if_none_match.contains_weak(etag):
+        resp = make_response("", 304)
+      elif (snap := snapshot_file()) and os.path.exists(snap):
+        with open(snap, encoding = "utf8") as fh:
+          resp = make_response(fh.read())
+      else:
+        resp = f(*a, **k)
+      resp.set_etag(etag)
+      resp.last_modified = START
+      resp.cache_control.no_cache = True
+      if not CONF_PREFS: resp.vary.add("Cookie")
+      return resp
+    return g
+  return decorator
+
+# NB: snapshots are only used when prefs come from cookies; they are
+# keyed on the page & the prefs it is rendered with, and invalidated
+# by any change to the version, the code (incl. templates & static
+# files, see code_hash) or the DBs
+def snapshot_file():
+  if CONF_PREFS: return None
+  try:
+    dbs = [ os.stat(f) for f in (J.SQLITE_FILE, K.SQLITE_FILE) ]
+  except OSError:
+    return None
+  key = (J.DBVERSION, __version__, code_hash(), request.full_path,
+         [ (s.st_size, s.st_mtime_ns) for s in dbs ],
+         sorted(page_prefs(get_prefs()).items()))
+  name = hashlib.sha1(repr(key).encode()).hexdigest()
+  return os.path.join(PAGES_DIR, name + ".html")
+
+# NB: snapshots are rendered by another process (w/ another START, so
+# ?s= differs), but w/ the same code, templates & static files
+@functools.lru_cache(maxsize = None)
+def code_hash():
+  h, base = hashlib.sha1(), os.path.dirname(os.path.abspath(__file__))
+  for d in ("", "templates", "static"):
+    for f in sorted(os.listdir(os.path.join(base, d))):
+      p = os.path.join(base, d, f)
+      if f.endswith((".py", ".html", ".css", ".js")) and \
+         os.path.isfile(p):
+        with open(p, "rb") as fh: h.update(f.encode() + fh.read())
+  return h.hexdigest()
+
+def snapshot_urls():
+  yield "/kanji/by-freq"
+  yield "/kanji/by-level"
+  yield "/kanji/by-jlpt"
+  for n in range(1, 5): yield "/kanji/by-skip/{}".format(n)
+  pages = [ ("/jmdict/by-freq", lambda **kw: (
+              e for e, _ in J.by_freq(0, 1000, **kw) )) ] + [
+    ("/jmdict/by-jlpt/{}".format(n),
+     functools.partial(J.by_jlpt, n, 0, 1000)) for n in range(1, 6)
+  ]
+  for path, f in pages:
+    yield path
+    yield path + "?offset=0"
+    cur, offset = {}, 0
+    while es := list(f(**cur)):
+      if offset:
+        yield "{}?offset={}&before={}".format(path, offset - 1000,
+                                              es[0].seq)
+      cur, offset = dict(after = es[-1].seq), offset + 1000
+      yield "{}?offset={}&after={}".format(path, offset, es[-1].seq)
+    if offset > 1000:
+      yield "{}?offset={}".format(path, offset - 1000)
+
+# NB: renders every listing page (incl. the empty one after the last
+# page), reached via both next & previous links, for each combination
+# of PAGES_PREFS (w/ the other prefs at their defaults); replaces any
+# existing snapshots
+def prerender(verbose = False):
+  shutil.rmtree(PAGES_DIR, ignore_errors = True)
+  os.makedirs(PAGES_DIR)
+  adapter, n = app.url_map.bind("localhost"), 0
+  for url in snapshot_urls():
+    endpoint, args = adapter.match(url.split("?")[0])
+    view = app.view_functions[endpoint]
+    for vs in itertools.product(["no", "yes"],
+                                repeat = len(PAGES_PREFS)):
+      cookie = "; ".join( "{}={}".format(k, v)
+                          for k, v in zip(PAGES_PREFS, vs) )
+      hdrs   = dict(Cookie = cookie)
+      with app.test_request_context(url, headers = hdrs):
+        snap, data = snapshot_file(), view(**args).get_data()
+      with open(snap + ".tmp", "wb") as fh: fh.write(data)
+      os.replace(snap + ".tmp", snap)
+      n += 1
+    if verbose: print(url)
+  return n
 
 def get_langs(prefs = None):
   if prefs is None: prefs = get_prefs()
   ls = request.args.getlist("lang") or prefs.get("lang", "").split()
   return [ l for l in ls if l in J.LANGS ] or [J.LANGS[0]]
 
+def get_cursor():
+  return { k: v for k in "after before".split()
+           if (v := arg(k, None, type = int)) is not None }
+
 def get_sentence_langs():
   ls = request.args.getlist("lang")
   return [ l for l in ls if l in S.LANGS ]
@@ -360,30 +600,34 @@ def r_jmdict():
   query, max_r = get_query_max()
   opts = dict(langs = get_langs(), max_results = max_r, **filters)
   data = dict(page = "jmdict", query = query)
-  if query: data["results"] = J.search(query, **opts)
-  with K.readmeans() as f, P.pitches() as g:
-    return respond("jmdict.html", "jmdict", krm = f, elem_pitch = g, **data)
+  if query: data["results"] = prefetched(J.search(query, **opts))
+  using = dict(krm = K.readmeans, elem_pitch = J.pitches)
+  return respond("jmdict.html", "jmdict", stream = True, using = using,
+                 **data)
 
 @app.route("/jmdict/by-freq")
+@cacheable(J.SQLITE_FILE)
 def r_jmdict_by_freq():
   offset  = arg("offset", 0, type = int)
-  results = list(J.by_freq(offset, 1000))
+  results = list(J.by_freq(offset, 1000, **get_cursor()))
   return respond("jmdict-by-freq.html", "jmdict by frequency",
-                 page = "jmdict/by-freq", offset = offset,
-                 results = results)
+                 stream = True, page = "jmdict/by-freq",
+                 offset = offset, results = results)
 
 @app.route("/jmdict/by-jlpt/1")
 @app.route("/jmdict/by-jlpt/2")
 @app.route("/jmdict/by-jlpt/3")
 @app.route("/jmdict/by-jlpt/4")
 @app.route("/jmdict/by-jlpt/5")
+@cacheable(J.SQLITE_FILE)
 def r_jmdict_by_jlpt():
   n       = int(request.path.split("/")[-1])
   offset  = arg("offset", 0, type = int)
-  results = list(J.by_jlpt(n, offset, 1000))
+  results = list(J.by_jlpt(n, offset, 1000, **get_cursor()))
   title   = "jmdict by jlpt - n{}".format(n)
-  return respond("jmdict-by-jlpt.html", title, page = request.path[1:],
-                 level = n, offset = offset, results = results)
+  return respond("jmdict-by-jlpt.html", title, stream = True,
+                 page = request.path[1:], level = n, offset = offset,
+                 results = results)
 
 # FIXME: legacy route
 @app.route("/jmdict/random")
@@ -399,21 +643,24 @@ def r_kanji():
   query, max_r = get_query_max()
   opts = dict(max_results = max_r, **filters)
   data = dict(page = "kanji", query = query)
-  if query: data["results"] = K.search(query, **opts)
-  return respond("kanji.html", "kanji", **data)
+  if query: data["results"] = prefetched(K.search(query, **opts))
+  return respond("kanji.html", "kanji", stream = True, **data)
 
 @app.route("/kanji/by-freq")
+@cacheable(K.SQLITE_FILE)
 def r_kanji_by_freq():
   return respond("kanji-by-freq.html", "kanji by frequency",
                  page = "kanji/by-freq", kanji = K.by_freq())
 
 @app.route("/kanji/by-level")
+@cacheable(K.SQLITE_FILE)
 def r_kanji_by_level():
   levels = [ (l, list(K.by_level(l))) for l in K.LEVELS ]
   return respond("kanji-by-level.html", "kanji by level",
                  page = "kanji/by-level", levels = levels)
 
 @app.route("/kanji/by-jlpt")
+@cacheable(K.SQLITE_FILE)
 def r_kanji_by_jlpt():
   return respond("kanji-by-jlpt.html", "kanji by jlpt",
                  page = "kanji/by-jlpt")
@@ -422,6 +669,7 @@ def r_kanji_by_jlpt():
 @app.route("/kanji/by-skip/2")
 @app.route("/kanji/by-skip/3")
 @app.route("/kanji/by-skip/4")
+@cacheable(K.SQLITE_FILE)
 def r_kanji_by_skip():
   category  = int(request.path.split("/")[-1])
   title     = "kanji by skip code - {}".format(category)
@@ -439,9 +687,9 @@ def r_sentences():
   opts = dict(langs = get_sentence_langs(), max_results = max_r,
               audio = arg_bool("audio"))
   data = dict(page = "sentences", query = query)
-  if query: data["results"] = S.search(query, **opts)
-  with K.readmeans() as f:
-    return respond("sentences.html", "sentences", krm = f, **data)
+  if query: data["results"] = prefetched(S.search(query, **opts))
+  return respond("sentences.html", "sentences", stream = True,
+                 using = dict(krm = K.readmeans), **data)
 
 @app.route("/stroke")
 def r_stroke():
@@ -460,6 +708,22 @@ def r_kanji_matches():
   ms = kanjidraw.matches(strokes, fuzzy = fuzzy, offby1 = offby1)
   return "".join( kanji for _, kanji in ms )
 
+# NB: only in debug mode
+@app.route("/_cache_stats")
+def r_cache_stats():
+  if not app.debug: abort(404)
+  return flask.json.jsonify(cache_stats())
+
+@app.route("/_complete")
+def r_complete():
+  return flask.json.jsonify(J.complete(arg("q", "")))
+
+@app.route("/_radicals")
+def r_radicals():
+  kanji, count, radicals = K.radical_candidates(arg("q", ""), MAX)
+  return flask.json.jsonify(dict(kanji = kanji, count = count,
+                                 radicals = radicals))
+
 @app.route("/_db/v<int:db_version>/<base>")
 def r_db(db_version, base):
   return redirect(M.DB_URLS[db_version][base])
@@ -39,7 +39,7 @@ CLI
     kana alone | colloquialism
 
 >>> run("-v jmdict -m1 -w cat")
-DB v14 up to date.
+DB v23 up to date.
 query: +w cat
 <BLANKLINE>
 猫
@@ -58,7 +58,7 @@ see 猫車 | 猫火鉢
 seq# 1467640, freq# 2201, jlpt N5, prio; 1
 
 >>> run("-v jmdict -m1 -w kat -l dut")
-DB v14 up to date.
+DB v23 up to date.
 query: +w kat
 <BLANKLINE>
 猫
@@ -74,7 +74,7 @@ see 猫車 | 猫火鉢
 seq# 1467640, freq# 2201, jlpt N5, prio; 1
 
 >>> run("-v jmdict -m1 -w absurd")
-DB v14 up to date.
+DB v23 up to date.
 query: +w absurd
 <BLANKLINE>
 馬鹿 | 莫迦 | 破家 | 馬稼
@@ -94,7 +94,7 @@ see 馬鹿貝
 seq# 1601260, freq# 2472, jlpt N3, prio; 1
 
 >>> run("-v jmdict -m1 -e 誤魔化す")
-DB v14 up to date.
+DB v23 up to date.
 query: += 誤魔化す
 <BLANKLINE>
 誤魔化す | 誤摩化す | 胡麻化す | 誤魔かす | 胡魔化す
@@ -111,7 +111,7 @@ query: += 誤魔化す
 seq# 1271480, freq# 10495, jlpt N1, prio; 1
 
 >>> run("-v jmdict -m1 -w まる")
-DB v14 up to date.
+DB v23 up to date.
 query: +w まる
 <BLANKLINE>
 丸 | 円
@@ -132,7 +132,7 @@ see ○ | まる | スッポン | 麻呂
 seq# 1216250, freq# 63, jlpt N3, prio; 1
 
 >>> run("-v jmdict -m1 -w cat --verb")
-DB v14 up to date.
+DB v23 up to date.
 query: +w cat
 <BLANKLINE>
 逆撫で | 逆なで
@@ -146,7 +146,7 @@ query: +w cat
 seq# 1227180, freq# 30500; 1
 
 >>> run("-v jmdict -m1 -w みる --noun")
-DB v14 up to date.
+DB v23 up to date.
 query: +w みる
 <BLANKLINE>
 海松 | 水松
@@ -160,19 +160,19 @@ query: +w みる
 seq# 1772790, freq# 75; 1
 
 >>> run("-v jmdict -m1 -w みる --noun --prio")
-DB v14 up to date.
+DB v23 up to date.
 query: +w みる
 <BLANKLINE>
 
 >>> run("-v jmdict -n5 +random") # doctest: +ELLIPSIS
-DB v14 up to date.
+DB v23 up to date.
 query: +random
 <BLANKLINE>
 ...
 seq# ... jlpt N5...
 
 >>> run("-v jmdict -m1 --hiragana --romaji -w neko")
-DB v14 up to date.
+DB v23 up to date.
 query: +w ねこ
 <BLANKLINE>
 猫
@@ -191,7 +191,7 @@ see 猫車 | 猫火鉢
 seq# 1467640, freq# 2201, jlpt N5, prio; 1
 
 >>> run("-v jmdict -m1 --romaji -w +hneko")
-DB v14 up to date.
+DB v23 up to date.
 query: +w ねこ
 <BLANKLINE>
 猫
@@ -210,7 +210,7 @@ see 猫車 | 猫火鉢
 seq# 1467640, freq# 2201, jlpt N5, prio; 1
 
 >>> run("-v jmdict -m1 --romaji -w +kneko")
-DB v14 up to date.
+DB v23 up to date.
 query: +w ネコ
 <BLANKLINE>
 猫
@@ -229,7 +229,7 @@ see 猫車 | 猫火鉢
 seq# 1467640, freq# 2201, jlpt N5, prio; 1
 
 >>> run("-v jmdict -m1 --romaji", "+k +w ko-hi-")
-DB v14 up to date.
+DB v23 up to date.
 query: +w コーヒー
 <BLANKLINE>
 珈琲
@@ -253,7 +253,7 @@ seq# 1049180, freq# 3762, jlpt N5, prio; 1
 = cat
 
 >>> run("-v kanji -m1 -e cat")
-DB v14 up to date.
+DB v23 up to date.
 query: += cat
 <BLANKLINE>
 猫
@@ -276,7 +276,7 @@ variants: 貓
 11 strokes, level 常用, freq# 1702, old jlpt N2, jlpt N3, skip 1-3-8
 
 >>> run("-v kanji -m1 -w 日")
-DB v14 up to date.
+DB v23 up to date.
 query: +w 日
 <BLANKLINE>
 日
@@ -297,7 +297,7 @@ query: +w 日
 4 strokes, level 常用1, freq# 1, old jlpt N4, jlpt N5, skip 3-3-1
 
 >>> run("-v kanji -m1 +r犭艹田")
-DB v14 up to date.
+DB v23 up to date.
 query: +r犭艹田
 <BLANKLINE>
 猫
@@ -320,7 +320,7 @@ variants: 貓
 11 strokes, level 常用, freq# 1702, old jlpt N2, jlpt N3, skip 1-3-8
 
 >>> run("-v kanji -m1 +s2-3-3")
-DB v14 up to date.
+DB v23 up to date.
 query: +s2-3-3
 <BLANKLINE>
 当
@@ -373,7 +373,7 @@ variants: 當
 === Sentences ===
 
 >>> run("-v sentences -m1 -l eng,dut,ger,fre,spa,swe congratulations")
-DB v14 up to date.
+DB v23 up to date.
 query: congratulations
 <BLANKLINE>
 [jap] おめでとうございます。
@@ -386,7 +386,7 @@ query: congratulations
 tatoeba #4854; 1
 
 >>> run("-v sentences -m1 +#9365736")
-DB v14 up to date.
+DB v23 up to date.
 query: +#9365736
 <BLANKLINE>
 [jap] 子ネコは大好きだな。
@@ -442,12 +442,14 @@ name = "jiten"
 import click
 from click import style
 
-from . import jmdict    as J
 from . import kana
-from . import kanji     as K
 from . import misc      as M
-from . import pitch     as P
-from . import sentences as S
+
+# NB: lazy, so e.g. h2k does not need to import these
+J = M.lazy_import("jiten.jmdict")
+K = M.lazy_import("jiten.kanji")
+P = M.lazy_import("jiten.pitch")
+S = M.lazy_import("jiten.sentences")
 
 from .misc import SERVER
 
@@ -457,18 +459,49 @@ HISTFILE      = os.path.join(os.path.expanduser("~"),
 MODS          = [K, P, S, J] # J last!
 ANDROID_PRIV  = os.environ.get("ANDROID_PRIVATE") or None
 
-def setup_db(verbose, dl = False):
+def setup_db(verbose, dl = False, jobs = 1, update = False):
   msg = "up to date"
-  if not J.up2date():
+  if update and not dl and J.up2date() and not missing_data():
+    msg = "updated"
+    J.setup(incremental = True)
+  elif not J.up2date():
     if dl or missing_data():
       msg = "downloaded"
       download_dbs()
     else:
       msg = "set up"
-      for m in MODS: m.setup()
+      build_dbs(jobs)
   if verbose:
     click.secho("DB v{} {}.".format(J.DBVERSION, msg), fg = "green")
 
+# NB: the other DBs are built in worker processes (w/ their output
+# silenced) while jmdict is built here, its parsing sharded across the
+# same pool; J must still finish last
+def build_dbs(jobs = 1):
+  if jobs <= 1:
+    for m in MODS: m.setup()
+    return
+  from concurrent.futures import ProcessPoolExecutor
+  with ProcessPoolExecutor(jobs, initializer = _quiet_worker) as pool:
+    futs = [ pool.submit(_setup_mod, m.__name__) for m in MODS[:-1] ]
+    for f in futs: f.add_done_callback(_report_done)
+    J.setup(pool = pool, wait = lambda: [ f.result() for f in futs ])
+  _report_done(J.__name__)
+
+def _setup_mod(name):
+  import importlib
+  importlib.import_module(name).setup()
+  return name
+
+def _quiet_worker():
+  sys.stdout = open(os.devnull, "w")
+
+def _report_done(x):
+  if not isinstance(x, str):
+    if x.exception() is not None: return
+    x = x.result()
+  click.secho("{} done.".format(x.split(".")[-1]), fg = "green")
+
 def missing_data():
   for m in MODS:
     for f in m.DATA_FILES[1:]:
@@ -490,6 +523,14 @@ def android_link_dbs():
     if os.path.exists(f) and not os.path.islink(file):
       os.symlink(f, file)
 
+# NB: like click.version_option, but w/o importing jmdict unless used
+def show_version(ctx, param, value):
+  if not value or ctx.resilient_parsing: return
+  click.echo("{} 「辞典」 {} [{}] [DB v{}]".format(
+    ctx.find_root().info_name, __version__, py_version, J.DBVERSION
+  ))
+  ctx.exit()
+
 @click.group(help = """
   jiten - japanese android/cli/web dictionary based on jmdict/kanjidic
 """)
@@ -499,10 +540,9 @@ def android_link_dbs():
 @click.option("-p", "--pager", default = "less -FR",
               show_default = True,
               help = "Set $PAGER (unless empty).")
-@click.version_option(
-  "{} [{}] [DB v{}]".format(__version__, py_version, J.DBVERSION),
-  message = "%(prog)s 「辞典」 %(version)s"
-)
+@click.option("--version", is_flag = True, expose_value = False,
+              is_eager = True, callback = show_version,
+              help = "Show the version and exit.")
 @click.pass_context
 def cli(ctx, colour, pager, **kw):
   if colour is not None: ctx.color = colour
@@ -515,9 +555,9 @@ def cli(ctx, colour, pager, **kw):
   For a random entry use +random.
 """)
 @click.option("-l", "--lang", "langs", multiple = True,
-              default = [J.LANGS[0]], show_default = True,
+              default = [M.LANGS[0]], show_default = True,
               metavar = "LANG", envvar = name.upper() + "_LANGS",
-              help = "Choose language(s) ["+", ".join(J.LANGS)+"].")
+              help = "Choose language(s) ["+", ".join(M.LANGS)+"].")
 @click.option("-w", "--word", is_flag = True,
               help = "Match whole word (same as \\b...\\b).")
 @click.option("-1", "--1stword", "--first-word", "fstwd", is_flag = True,
@@ -551,38 +591,40 @@ def jmdict_search(q, verbose, word, exact, fstwd, langs, romaji,
   f     = kana.with_romaji if romaji else lambda x: x
   if verbose:
     yield "query: " + style(q, fg = "bright_red") + "\n\n"
-  for i, (e, rank) in enumerate(J.search(q, langs = langs, **kw)):
-    if i != 0: yield "\n"
-    yield (" | ".join(
-      style(k.elem, fg = "bright_yellow") for k in e.kanji
-    ) or "[no kanji]") + "\n"
-    yield (" | ".join(
-      style(f(r.elem), fg = "bright_green") for r in e.reading
-    ) or "[no readings]") + "\n"
-    if P.have_pitch():
+  with J.pitches() as pitch:
+    results = J.search(q, langs = langs, **kw)
+    for i, (e, rank) in enumerate(pitch.batched(results)):
+      if i != 0: yield "\n"
       yield (" | ".join(
-        style(f(p), fg = "cyan") for p in e.pitch()
-      ) or "[no pitch data]") + "\n"
-    else:
-      yield "[pitch data unavailable]\n"
-    gloss, info = e.gloss_pos_info(langs)
-    for l in langs:
-      if not gloss[l]: continue
-      yield style("[" + l + "]", fg = "blue") + "\n"
-      for g in gloss[l]:
-        yield indent_and_wrap(w, g, "= ", "magenta")
-    t = indent_and_wrap(w, info, "--> ", "green")
-    if t: yield t
-    if verbose:
-      ti = indent_and_wrap(w, e.xinfo(), "~~> ", "blue")
-      if ti: yield ti
-      tx = indent_and_wrap(w, e.xrefs(), "see ", "yellow")
-      if tx: yield tx
-      yield "seq# " + style(str(e.seq), fg = "blue")
-      if rank:        yield ", freq# " + style(str(rank), fg = "cyan")
-      if e.jlpt:      yield ", jlpt " + style("N"+str(e.jlpt), fg = "yellow")
-      if e.isprio():  yield ", prio"
-      yield "; " + str(i+1) + "\n"
+        style(k.elem, fg = "bright_yellow") for k in e.kanji
+      ) or "[no kanji]") + "\n"
+      yield (" | ".join(
+        style(f(r.elem), fg = "bright_green") for r in e.reading
+      ) or "[no readings]") + "\n"
+      if pitch.available:
+        yield (" | ".join(
+          style(f(p), fg = "cyan") for p in pitch(e)
+        ) or "[no pitch data]") + "\n"
+      else:
+        yield "[pitch data unavailable]\n"
+      gloss, info = e.gloss_pos_info(langs)
+      for l in langs:
+        if not gloss[l]: continue
+        yield style("[" + l + "]", fg = "blue") + "\n"
+        for g in gloss[l]:
+          yield indent_and_wrap(w, g, "= ", "magenta")
+      t = indent_and_wrap(w, info, "--> ", "green")
+      if t: yield t
+      if verbose:
+        ti = indent_and_wrap(w, e.xinfo(), "~~> ", "blue")
+        if ti: yield ti
+        tx = indent_and_wrap(w, e.xrefs(), "see ", "yellow")
+        if tx: yield tx
+        yield "seq# " + style(str(e.seq), fg = "blue")
+        if rank:        yield ", freq# " + style(str(rank), fg = "cyan")
+        if e.jlpt:      yield ", jlpt " + style("N"+str(e.jlpt), fg = "yellow")
+        if e.isprio():  yield ", prio"
+        yield "; " + str(i+1) + "\n"
                                                                 # }}}1
 
 def search(f, ctx, q, hiragana, katakana, **kw):
@@ -651,7 +693,7 @@ def terminal_width():
               help = "Select by level(s); e.g. 常用1 or 常用5-人名.")
 @click.option("-n", "--jlpt", type = M.JLPT_LEVEL,
               help = "Select by JLPT level(s); e.g. 1 or 3-5.")
-@click.option("-s", "--strokes", type = K.STROKES_T,
+@click.option("-s", "--strokes", type = M.STROKES_T,
               help = "Select by number of strokes; e.g. 1 or 10-15.")
 @click.option("--romaji", is_flag = True, help = "Show romaji.")
 @click.option("-h", "--hiragana", is_flag = True,
@@ -723,7 +765,7 @@ def kanji_search(q, verbose, word, exact, fstwd, romaji, **kw): # {{{1
 @click.option("-l", "--lang", "langs", multiple = True,
               default = [], metavar = "LANG",
               envvar = name.upper() + "_LANGS",
-              help = "Filter language(s) ["+", ".join(S.LANGS)+"].")
+              help = "Filter language(s) ["+", ".join(M.LANGS)+"].")
 @click.option("-m", "--max", "max_results", default = None,
               type = click.INT, help = "Maximum number of results.")
 @click.option("-h", "--hiragana", is_flag = True,
@@ -796,9 +838,28 @@ def gui(ctx, link):
 @cli.command(help = "Build (or download) sqlite databases.")
 @click.option("--download", is_flag = True,
               help = "Always download DBs, never build them.")
-def setup(download):
-  click.echo("Creating databases...")
-  setup_db(True, download)
+@click.option("-j", "--jobs", default = 1, show_default = True,
+              type = click.IntRange(1), metavar = "N",
+              help = "Build DBs using N processes.")
+@click.option("-u", "--update", is_flag = True,
+              help = "Only update changed JMDict entries "
+                     "(if up to date).")
+def setup(download, jobs, update):
+  click.echo("Updating databases..." if update else
+             "Creating databases...")
+  setup_db(True, download, jobs, update)
+
+@cli.command(help = """
+  Prerender the listing pages (by frequency, jlpt, level, skip code)
+  of the web interface for each light/dark/large/romaji combination.
+  The app serves these directly while the DBs don't change.
+""")
+@click.pass_context
+def prerender(ctx):
+  setup_db(ctx.obj["verbose"])
+  from .app import prerender
+  n = prerender(ctx.obj["verbose"])
+  click.secho("{} pages prerendered.".format(n), fg = "green")
 
 @cli.command(help = "Convert hiragana to katakana.")
 @click.option("--long", is_flag = True, help = "Convert long vowels to 'ー'.")
@@ -834,6 +895,43 @@ def doctest(ctx):
   import doctest
   if doctest.testmod(verbose = ctx.obj["verbose"])[0]: ctx.exit(1)
 
+# NB: like -X importtime, but aggregated per (top-level) module; the
+# jiten modules are shown separately; min over the runs
+@cli.command("_profile-startup", hidden = True)
+@click.option("-r", "--repeat", default = 5, show_default = True,
+              type = click.IntRange(1), help = "Number of runs.")
+@click.option("-n", "--top", default = 20, show_default = True,
+              type = click.IntRange(1),
+              help = "Number of modules to show.")
+@click.argument("args", nargs = -1)
+def profile_startup(repeat, top, args):
+  import subprocess
+  cmd   = [sys.executable, "-X", "importtime"] + \
+          (["-m", "jiten.cli"] + list(args) if args else
+           ["-c", "import jiten.cli"])
+  root  = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  path  = [root] + [ x for x in [os.environ.get("PYTHONPATH")] if x ]
+  env   = dict(os.environ, PYTHONPATH = os.pathsep.join(path))
+  times = {}
+  for _ in range(repeat):
+    p = subprocess.run(cmd, env = env, stdin = subprocess.DEVNULL,
+                       stdout = subprocess.DEVNULL,
+                       stderr = subprocess.PIPE, text = True)
+    run = {}
+    for line in p.stderr.splitlines():
+      if not line.startswith("import time:"): continue
+      t, _, mod = line[12:].split("|")
+      if not t.strip().isdigit(): continue
+      mod = mod.strip()
+      key = mod if mod.startswith("jiten") else mod.split(".")[0]
+      run[key] = run.get(key, 0) + int(t)
+    for k, v in run.items(): times[k] = min(times.get(k, v), v)
+  data = sorted(times.items(), key = lambda x: x[1], reverse = True)
+  for mod, t in data[:top]:
+    click.echo("{:8.1f} ms  {}".format(t / 1000, mod))
+  click.echo("{:8.1f} ms  {}".format(sum(times.values()) / 1000,
+                                     style("total", bold = True)))
+
 @cli.command("_serve", hidden = True)
 @click.argument("running")
 @click.argument("done")
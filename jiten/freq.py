@@ -18,10 +18,12 @@ r"""
 
 Word frequencies.
 
->>> len(news_freq)
+>>> len(parse_freq(NEWSFREQ_FILE, True))
 142193
->>> len(book_freq)
+>>> len(parse_freq(BOOKFREQ_FILE, False))
 89222
+>>> len(news_freq), len(book_freq)
+(142193, 89222)
 
 >>> most_freq_kanji = "人一日大年出本中子見"
 >>> some_words = '''ブログ について 日 人 日本 学校 問題 世界 大学
@@ -35,15 +37,17 @@ Word frequencies.
 
 """                                                             # }}}1
 
-import sys
+import os, sqlite3, sys
 
-from collections import defaultdict
 from fractions import Fraction
 
 from . import misc as M
+from .sql import sqlite_do, sqlite_bulk, have_table
 
+CACHEVERSION    = 1
 NEWSFREQ_FILE   = M.resource_path("res/freq/wordfreq_ck.utf8")
 BOOKFREQ_FILE   = M.resource_path("res/freq/base_aggregates.txt.nobom")
+CACHE_FILE      = M.resource_path("res/freq/freq.sqlite3")
 
 EXCEPTIONS      = "Tシャツ".split()
 NOFREQ          =  999999
@@ -65,36 +69,95 @@ def parse_freq(file, word_first):                               # {{{1
   return data
                                                                 # }}}1
 
-def process_freq(data):
-  tot, data_ = sum(data.values()), {}
-  for k, v in data.items(): data_[k] = Fraction(v, tot)
-  return data_
-
-def merge_freq(*fs):
-  data = defaultdict(Fraction)
-  for f in fs:
-    for k, v in f.items(): data[k] += v
-  return dict(data)
-
-def rank_freq(data):
-  d = dict( (k,float(v)) for k, v in data.items() )
+# NB: the relative frequencies news[w]/t1 + book[w]/t2 are represented
+# by their numerators news[w]*t2 + book[w]*t1 over the common
+# denominator t1*t2; this avoids Fraction arithmetic and int/int true
+# division is correctly rounded, so ranks are the same as before
+def merge_freq(news, book):
+  t1, t2 = sum(news.values()), sum(book.values())
+  data = dict( (k, v*t2) for k, v in news.items() )
+  for k, v in book.items(): data[k] = data.get(k, 0) + v*t1
+  return data, t1*t2
+
+def rank_freq(data, denom):
+  d = dict( (k, v/denom) for k, v in data.items() )
   l = sorted(d, key = lambda k: (d[k], k), reverse = True)
   return dict( (x,i) for i, x in enumerate(l, 1) )
 
 def rank(w): return freq_rank.get(w, NOFREQ)
 
-def setup():
-  global news_freq, book_freq, freq, freq_rank
+def freq_sum(ws):
+  return Fraction(sum( freq.get(w, 0) for w in ws ), denom)
+
+# NB: the merged counts & ranks are cached in CACHE_FILE (keyed on the
+# source files) and reused across builds
+def setup(file = CACHE_FILE):
+  global news_freq, book_freq, freq, denom, freq_rank
   if setup.done: return
   setup.done = True
 
-  news_freq = process_freq(parse_freq(NEWSFREQ_FILE, True))
-  book_freq = process_freq(parse_freq(BOOKFREQ_FILE, False))
-
-  freq      = merge_freq(news_freq, book_freq)
-  freq_rank = rank_freq(freq)
+  if not load_cache(file):
+    news_freq = parse_freq(NEWSFREQ_FILE, True)
+    book_freq = parse_freq(BOOKFREQ_FILE, False)
+    freq, denom = merge_freq(news_freq, book_freq)
+    freq_rank = rank_freq(freq, denom)
+    try:
+      save_cache(file)
+    except (OSError, sqlite3.Error):
+      pass                                          # e.g. read-only
 setup.done = False
 
+def cache_key():
+  return repr([CACHEVERSION] + [
+    (os.path.basename(f), st.st_size, st.st_mtime_ns)
+    for f in (NEWSFREQ_FILE, BOOKFREQ_FILE) for st in [os.stat(f)]
+  ])
+
+def load_cache(file):                                           # {{{1
+  global news_freq, book_freq, freq, denom, freq_rank
+  if not os.path.exists(file): return False
+  with sqlite_do(file) as c:
+    if not have_table(c.connection, "meta"): return False
+    t1, t2, key = c.execute("SELECT t1, t2, key FROM meta").fetchone()
+    if key != cache_key(): return False
+    news_freq, book_freq, freq, freq_rank = {}, {}, {}, {}
+    for w, n, b, r in c.execute("SELECT * FROM freq"):
+      if n: news_freq[w] = n
+      if b: book_freq[w] = b
+      freq[w], freq_rank[w] = n*int(t2) + b*int(t1), r
+  denom = int(t1) * int(t2)
+  return True
+
+def save_cache(file):
+  t1, t2 = sum(news_freq.values()), sum(book_freq.values())
+  with sqlite_bulk(file) as c:
+    c.executescript(FREQ_CREATE_SQL)
+    c.executemany("INSERT INTO freq VALUES (?,?,?,?)", (
+      (w, news_freq.get(w, 0), book_freq.get(w, 0), r)
+      for w, r in freq_rank.items()
+    ))
+    c.execute("INSERT INTO meta VALUES (?,?,?)",
+              (str(t1), str(t2), cache_key()))
+                                                                # }}}1
+
+# NB: totals as TEXT (may not fit in INTEGER)
+FREQ_CREATE_SQL = """
+  DROP TABLE IF EXISTS freq;
+  DROP TABLE IF EXISTS meta;
+
+  CREATE TABLE freq(
+    word TEXT PRIMARY KEY,
+    news INTEGER,
+    book INTEGER,
+    rank INTEGER
+  ) WITHOUT ROWID;
+  CREATE TABLE meta(
+    t1 TEXT,
+    t2 TEXT,
+    key TEXT
+  );
+"""
+
 if __name__ == "__main__":
   if "--doctest" in sys.argv:
     verbose = "--verbose" in sys.argv
@@ -24,7 +24,7 @@ JMDict.
 >>> click.progressbar = _progressbar
 
 >>> DBVERSION
-14
+23
 
 >>> jmdict = parse_jmdict()
 >>> len(jmdict)
@@ -222,33 +222,125 @@ word containing out-dated kanji or kanji usage
 >>> len([ r for r in mixd if r2k(k2r(r, True)) != h2k(r) ])
 0
 
+>>> seqs = lambda q: [ e.seq for e, _ in search(q) ]
+>>> seqs("+= いく") == seqs("+= " + r2h("iku"))
+True
+>>> seqs("+= イク") == seqs("+= " + r2k("iku"))
+True
+>>> iku.seq in seqs("+= いく"), iku.seq in seqs("+= イク")
+(True, False)
+>>> seqs("+1 ばか") == seqs("+1 " + r2h("baka"))
+True
+>>> seqs("+1 バカ") == seqs("+1 " + r2k("baka"))
+True
+>>> all( any( r.elem.startswith("バカ") for r in e.reading )
+...      for e, _ in search("+1 バカ") )
+True
+
+>>> _succ("ねこ"), _succ("a\U0010ffff"), _succ(""), _succ("\U0010ffff")
+('ねご', 'b', '\U0010ffff', '\U0010ffff\U0010ffff')
+>>> [ "ねこ" in complete(q) for q in "ねこ ネコ neko NEKO".split() ]
+[True, True, True, True]
+>>> complete("ね", 5) == complete("ね", 2 * COMPLETE_MAX)[:5]
+True
+>>> "cat" in complete("cat")
+True
+>>> complete(""), complete("  ")
+([], [])
+
+>>> seq = lambda x: x[0].seq
+>>> p1, p2 = list(by_freq()), list(by_freq(1000))
+>>> list(by_freq(after = seq(p1[-1]))) == p2
+True
+>>> list(by_freq(before = seq(p2[0]))) == p1
+True
+>>> p1, p2 = list(by_freq(0, 10)), list(by_freq(10, 10))
+>>> list(by_freq(limit = 10, after = seq(p1[-1]))) == p2
+True
+>>> list(by_freq(limit = 10, before = seq(p2[0]))) == p1
+True
+>>> p1, p2 = list(by_jlpt(5, 0, 2)), list(by_jlpt(5, 2, 2))
+>>> list(by_jlpt(5, limit = 2, after = p1[-1].seq)) == p2
+True
+>>> list(by_jlpt(5, limit = 2, before = p2[0].seq)) == p1
+True
+
+
+>>> import tempfile
+>>> tmp = tempfile.TemporaryDirectory()
+>>> inc, full = ( os.path.join(tmp.name, f) for f in "ab" )
+>>> def derived(file):
+...   with sqlite_do(file) as c:
+...     return [ sorted(map(tuple, c.execute(q))) for q in (
+...       "SELECT n, key FROM entry_sample",
+...       "SELECT * FROM complete", "SELECT * FROM complete_top",
+...       "SELECT name, entry FROM entry_tag JOIN tag ON id = tag",
+...       "SELECT * FROM pitch") ]
+>>> F.setup()
+>>> old = jmdict[:100]
+>>> s   = old[0].sense[0]._replace(gloss = ("changed",), pos = ("new",))
+>>> new = [old[0]._replace(sense = (s,) + old[0].sense[1:])] + \
+...       old[2:] + [jmdict[100]]
+>>> jmdict2sqldb(old, inc)
+>>> jmdict2sqldb(new, full)
+>>> derived(inc) == derived(full)
+False
+
+>>> g = jmdict2sqldb_incremental.__globals__
+>>> def interrupted(c): raise RuntimeError("interrupted")
+>>> g["tags2sqldb"], tags2sqldb_ = interrupted, g["tags2sqldb"]
+>>> jmdict2sqldb_incremental(new, inc)
+Traceback (most recent call last):
+  ...
+RuntimeError: interrupted
+>>> g["tags2sqldb"] = tags2sqldb_
+>>> jmdict2sqldb_incremental(new, inc)
+(2, 1)
+>>> jmdict2sqldb_incremental(new, inc)
+(0, 0)
+>>> derived(inc) == derived(full)
+True
+>>> ("new", old[0].seq) in derived(inc)[3]
+True
+>>> tmp.cleanup()
+
 """                                                             # }}}1
 
-import gzip, os, re, sys
-import xml.etree.ElementTree as ET
+import functools, gzip, hashlib, io, itertools, os, re, sys
 
-from collections import namedtuple
+from collections import deque, namedtuple
+from contextlib import contextmanager
 
 import click
 
 from . import freq  as F
 from . import misc  as M
 from . import pitch as P
-from .kana import katakana2hiragana
-from .sql import sqlite_do, load_pcre_extension
+from .kana import kana2romaji, katakana2hiragana
+from .sql import sqlite_do, sqlite_bulk, insert_rows, \
+                 load_pcre_extension, have_fts5, have_table, \
+                 ResultCache, sample2sqldb, random_keys
 
-DBVERSION       = 14 # NB: update this when data/schema changes
+DBVERSION       = 23 # NB: update this when data/schema changes
 SQLITE_FILE     = M.resource_path("res/jmdict.sqlite3")
 JMDICT_FILE     = M.resource_path("res/jmdict/jmdict.xml.gz")
 JLPT_FILE_BASE  = M.resource_path("res/jlpt/N")
 DATA_FILES      = (SQLITE_FILE, JMDICT_FILE)
 
 MAXSEQ          = 10000000
+MAXVARS         = 500     # NB: SQLITE_MAX_VARIABLE_NUMBER >= 999
+MAXGRAMS        = 8
+COMPLETE_MAX    = 10
+COMPLETE_TOP    = 2       # NB: precomputed for prefixes up to this
+CHUNK_SIZE      = 5000    # NB: entries per (parallel) parse job
+CHUNKS_AHEAD    = 8       # NB: max. parse jobs in flight
+PITCH_CHUNK     = 50      # NB: entries per pitch query (see pitches)
 PRIO            = dict(news1 = 10, news2 = 1, ichi1 = 10, ichi2 = 1,
                        spec1 = 10, spec2 = 5, gai1  = 10, gai2  = 1)
 MINPRIO         = 5
 USUKANA         = "word usually written using kana alone"
-LANGS           = "eng dut ger fre spa swe".split()
+LANGS           = M.LANGS
+CACHE           = ResultCache("jmdict", DBVERSION)
 JLPTKK, JLPTUK  = JLPTKANA = "[katakana]", "[usukana]"
 
 Entry   = namedtuple("Entry"  , """seq jlpt kanji reading sense""".split())
@@ -276,7 +368,7 @@ def charsets(e): return frozenset( k.chars for k in e.kanji )
 def chars(e): return frozenset(M.flatten( k.chars for k in e.kanji ))
 
 # TODO: load from DB
-def _freq(e): return sum( F.freq.get(w, 0) for w in e.definition() )
+def _freq(e): return F.freq_sum(e.definition())
 
 # TODO: load from DB
 def _rank(e): return min( F.rank(w) for w in e.definition() )
@@ -312,22 +404,51 @@ def xinfo(e):
 
 def xrefs(e): return M.uniq( x for s in e.sense for x in s.xref )
 
-def pitch(e, conn = None): return M.uniq(pitch_w_dups(e, conn))
+def pitch(e, file = SQLITE_FILE):
+  with pitches(file) as lookup: return tuple(lookup(e))
 
-# TODO
-def pitch_w_dups(e, conn = None):
-  rs = tuple( r.elem for r in e.reading )
-  hr = tuple( katakana2hiragana(r) for r in rs )
-  for r in rs + tuple( r for r in hr if r not in rs ):
-    p = P.get_pitch(r, e.definition(), conn = conn)
-    if p: yield p
+# NB: the pitches stored by pitch2sqldb; iterating over results w/
+# lookup.batched(results) loads those of PITCH_CHUNK entries at a
+# time, after which lookup(e) is a dict lookup; lookup.available is
+# False if there is no pitch data at all
+@contextmanager
+def pitches(file = SQLITE_FILE):
+  with sqlite_do(file) as c:
+    cache = {}
+    def lookup(e):
+      if e.seq in cache: return cache.pop(e.seq)
+      return load_pitches(c, [e.seq])[e.seq]
+    def batched(results, key = lambda x: x[0]):
+      it = iter(results)
+      while chunk := list(itertools.islice(it, PITCH_CHUNK)):
+        cache.update(load_pitches(c, [ key(x).seq for x in chunk ]))
+        yield from chunk
+    lookup.batched    = batched
+    lookup.available  = have_pitch(c)
+    yield lookup
+
+def have_pitch(c):
+  q = "SELECT 1 FROM pitch LIMIT 1"
+  return c.execute(q).fetchone() is not None
+
+def load_pitches(c, seqs):
+  data = { seq: [] for seq in seqs }
+  for i in range(0, len(seqs), MAXVARS):
+    chunk = seqs[i:i+MAXVARS]
+    ps    = ",".join("?" * len(chunk))
+    for seq, p in c.execute(f"""SELECT entry, pitch FROM pitch
+                                 WHERE entry IN ({ps})
+                                 ORDER BY entry, n""", chunk): # safe!
+      data[seq].append(p)
+  return { seq: tuple(ps) for seq, ps in data.items() }
 
 # TODO
 def jlpt_level(kanji, reading, usukana):                        # {{{1
   kana, prio  = not kanji or usukana, _isprio(kanji + reading)
   ls, ka      = set(), set( k.elem for k in kanji )
+  table       = load_jlpt()
   for k in ka:
-    jlpt = JLPT.get(k)
+    jlpt = table.get(k)
     if not jlpt: continue
     for r in reading:
       ls.update( n for x, n in jlpt if r.elem == x )
@@ -335,7 +456,7 @@ def jlpt_level(kanji, reading, usukana):                        # {{{1
     if r.elem in JLPT_COMMON:
       if (ka and not ka & JLPT_CO_KA) or \
          (not ka and r.elem not in JLPT_CO_NK): continue
-    jlpt = JLPT.get(r.elem)
+    jlpt = table.get(r.elem)
     if not jlpt: continue
     for x, n in jlpt:
       assert x in JLPTKANA
@@ -397,59 +518,104 @@ def _prio_r(e):
 
 def _kanji_chars(s): return frozenset( c for c in s if M.iskanji(c) )
 
+def parse_jmdict(file = JMDICT_FILE):
+  with click.progressbar(iter_jmdict(file), width = 0,
+                         label = "parsing jmdict") as bar:
+    return list(bar)
+
+# NB: streaming, does not keep the whole DOM in memory
+def iter_jmdict(file = JMDICT_FILE):
+  with gzip.open(file) as f:
+    for e in M.iterparse(f, "entry"):
+      yield parse_entry(e)
+
+# NB: parses chunks of entries using the (process) pool; order is
+# preserved; at most CHUNKS_AHEAD chunks are submitted (or parsed but
+# not yet consumed) at a time, to bound memory usage
+def iter_jmdict_parallel(pool, file = JMDICT_FILE, size = CHUNK_SIZE):
+  futs = deque()
+  for data in jmdict_chunks(file, size):
+    futs.append(pool.submit(_parse_chunk, data))
+    if len(futs) >= CHUNKS_AHEAD: yield from futs.popleft().result()
+  while futs: yield from futs.popleft().result()
+
+# NB: each chunk is a valid document w/ the header (incl. the DTD
+# entities) of the original; streams the (decompressed) file
+def jmdict_chunks(file = JMDICT_FILE, size = CHUNK_SIZE):
+  start, end = b"<JMdict>", b"</JMdict>"
+  with gzip.open(file) as f:
+    head = b""
+    for line in f:
+      if (i := line.find(start)) >= 0: break
+      head += line
+    else:
+      return
+    i              += len(start)
+    head, chunk, n = head + line[:i], [line[i:]], 0
+    for line in f:
+      n += line.count(b"</entry>")
+      if n < size:
+        chunk.append(line)
+        continue
+      j = line.rindex(b"</entry>") + len(b"</entry>")
+      yield head + b"".join(chunk) + line[:j] + end
+      chunk, n = [line[j:]], 0
+    rest = b"".join(chunk)
+    if b"<entry>" in rest: yield head + rest[:rest.rindex(end)] + end
+
+def _parse_chunk(data):
+  f = io.BytesIO(data)
+  return [ parse_entry(e) for e in M.iterparse(f, "entry") ]
+
 # TODO
 # * extract & use more fields!?
 #   - stagk, stagr, ...
 #   - adjective?
 # * assert kanji&reading only contain kanji&kana?
-def parse_jmdict(file = JMDICT_FILE):                           # {{{1
+def parse_entry(e):                                             # {{{1
   alang = "{http://www.w3.org/XML/1998/namespace}lang"
-  data  = []
-  with gzip.open(file) as f:
-    with click.progressbar(ET.parse(f).getroot(), width = 0,
-                           label = "parsing jmdict") as bar:
-      for e in bar:
-        seq, pos = int(e.find("ent_seq").text), ()
-        kanji, reading, sense = [], [], []
-        for ke in e.findall("k_ele"):           # 0+ kanji elem
-          keb   = ke.find("keb").text.strip()   # word/phrase w/ kanji
-          info  = tuple( x.text.strip() for x in ke.findall("ke_inf") )
-          assert all( "\n" not in x and "\x1e" not in x for x in info )
-          kanji.append(Kanji(keb, _kanji_chars(keb), info, _prio_k(ke)))
-        for re in e.findall("r_ele"):           # 1+ reading elem
-          reb   = re.find("reb").text.strip()   # reading elem
-          restr = tuple( x.text.strip() for x in re.findall("re_restr") )
-                  # reading only applies to keb subset
-          info  = tuple( x.text.strip() for x in re.findall("re_inf") )
-          assert all( "\n" not in x and "\x1e" not in x for xs in
-                      [restr, info] for x in xs )
-          reading.append(Reading(reb, restr, info, _prio_r(re)))
-        for se in e.findall("sense"):           # 1+ sense elem
-          pos   = tuple( x.text.strip() for x in se.findall("pos") ) or pos
-                  # part of speech, applies to following senses too
-          lang, gloss = None, []
-          for x in se.findall("gloss"):
-            l = x.get(alang, "eng")
-            if l in LANGS and x.text:
-              assert lang is None or lang == l
-              lang = l
-              gloss.append(x.text.strip())
-          if lang is None: continue
-          s_inf = tuple( x.text.strip() for x in se.findall("s_inf") )
-          misc  = tuple( x.text.strip() for x in se.findall("misc") )
-          xref  = tuple( y.strip() for x in se.findall("xref")
-                                   for y in x.text.split("・")
-                                   if not y.strip().isdigit() )
-          assert seq < MAXSEQ
-          assert all( "\n" not in x and "\x1e" not in x for xs in
-                      [pos, gloss, s_inf, misc, xref] for x in xs )
-          sense.append(Sense(pos, lang, tuple(gloss), s_inf + misc, xref))
-        krs   = ( tuple(x) for x in [kanji, reading, sense] )
-        jlpt  = jlpt_level(kanji, reading, _usukana(sense))
-        data.append(Entry(seq, jlpt, *krs))
-      return data
+  seq, pos = int(e.find("ent_seq").text), ()
+  kanji, reading, sense = [], [], []
+  for ke in e.findall("k_ele"):           # 0+ kanji elem
+    keb   = ke.find("keb").text.strip()   # word/phrase w/ kanji
+    info  = tuple( x.text.strip() for x in ke.findall("ke_inf") )
+    assert all( "\n" not in x and "\x1e" not in x for x in info )
+    kanji.append(Kanji(keb, _kanji_chars(keb), info, _prio_k(ke)))
+  for re in e.findall("r_ele"):           # 1+ reading elem
+    reb   = re.find("reb").text.strip()   # reading elem
+    restr = tuple( x.text.strip() for x in re.findall("re_restr") )
+            # reading only applies to keb subset
+    info  = tuple( x.text.strip() for x in re.findall("re_inf") )
+    assert all( "\n" not in x and "\x1e" not in x for xs in
+                [restr, info] for x in xs )
+    reading.append(Reading(reb, restr, info, _prio_r(re)))
+  for se in e.findall("sense"):           # 1+ sense elem
+    pos   = tuple( x.text.strip() for x in se.findall("pos") ) or pos
+            # part of speech, applies to following senses too
+    lang, gloss = None, []
+    for x in se.findall("gloss"):
+      l = x.get(alang, "eng")
+      if l in LANGS and x.text:
+        assert lang is None or lang == l
+        lang = l
+        gloss.append(x.text.strip())
+    if lang is None: continue
+    s_inf = tuple( x.text.strip() for x in se.findall("s_inf") )
+    misc  = tuple( x.text.strip() for x in se.findall("misc") )
+    xref  = tuple( y.strip() for x in se.findall("xref")
+                             for y in x.text.split("・")
+                             if not y.strip().isdigit() )
+    assert seq < MAXSEQ
+    assert all( "\n" not in x and "\x1e" not in x for xs in
+                [pos, gloss, s_inf, misc, xref] for x in xs )
+    sense.append(Sense(pos, lang, tuple(gloss), s_inf + misc, xref))
+  krs   = ( tuple(x) for x in [kanji, reading, sense] )
+  jlpt  = jlpt_level(kanji, reading, _usukana(sense))
+  return Entry(seq, jlpt, *krs)
                                                                 # }}}1
 
+# NB: only needed for setup; loaded (once) on first use
+@functools.lru_cache(maxsize = None)
 def load_jlpt(base = JLPT_FILE_BASE):                           # {{{1
   skip        = set("×|Ͼ立|あげる (=やる)|より、ほう".split("|"))
   kata        = "ローマじ ジェットき けしゴム".split()
@@ -489,34 +655,169 @@ def load_jlpt(base = JLPT_FILE_BASE):                           # {{{1
   return data
                                                                 # }}}1
 
-JLPT = load_jlpt()                                              # TODO
-
 # NB: kanji/reading/sense are retrieved in insertion (i.e. rowid) order!
-def jmdict2sqldb(data, file = SQLITE_FILE):                     # {{{1
-  with sqlite_do(file, write = True) as c:
+def jmdict2sqldb(data, file = SQLITE_FILE, wait = None):       # {{{1
+  with sqlite_bulk(file) as c:
     c.executescript(JMDICT_CREATE_SQL)
     with click.progressbar(data, width = 0, label = "writing jmdict") as bar:
-      for e in bar:
-        c.execute("INSERT INTO entry VALUES (?,?,?,?,?,?,?)",
-                  (e.seq, e.jlpt, e._rank(), str(e._freq()),
-                   e.prio_level(), e.isnoun(), e.isverb()))
-        for k in e.kanji:
-          c.execute("INSERT INTO kanji VALUES (?,?,?,?,?)",
-                    (e.seq, k.elem, "".join(sorted(k.chars)),
-                     "\n".join(k.info), k.prio))
-        for k in sorted(e.chars()):
-          c.execute("INSERT INTO kanji_code VALUES (?,?)",
-                    (e.seq, ord(k)))
-        for r in e.reading:
-          c.execute("INSERT INTO reading VALUES (?,?,?,?,?)",
-                    (e.seq, r.elem, "\n".join(r.restr),
-                     "\n".join(r.info), r.prio))
-        for s in e.sense:
-          c.execute("INSERT INTO sense VALUES (?,?,?,?,?,?)",
-                    (e.seq, "\n".join(s.pos), s.lang,
-                     "\n".join(s.gloss), "\n".join(s.info),
-                     "\n".join(s.xref)))
+      insert_rows(c, ( r for e in bar for r in entry_rows(e) ))
+    c.executescript(JMDICT_INDEX_SQL)
+    sample2sqldb(c, "entry", "seq")
+    complete2sqldb(c)
+    tags2sqldb(c)
+    if have_fts5(c.connection): c.executescript(JMDICT_FTS_SQL)
+    if wait: wait()
+    pitch2sqldb(c)
     c.execute("INSERT INTO version VALUES (?)", (DBVERSION,))
+
+# NB: the hash covers all rows of the entry (except itself)
+def entry_rows(e):
+  vals = (e.seq, e.jlpt, e._rank(), str(e._freq()), e.prio_level(),
+          e.isnoun(), e.isverb())
+  rows = list(elem_rows(e))
+  hash = hashlib.sha1(repr((vals, rows)).encode()).hexdigest()
+  yield ("INSERT INTO entry VALUES (?,?,?,?,?,?,?,?)", vals + (hash,))
+  yield from rows
+
+def elem_rows(e):
+  for k in e.kanji:
+    yield ("INSERT INTO kanji VALUES (?,?,?,?,?)",
+           (e.seq, k.elem, "".join(sorted(k.chars)), "\n".join(k.info),
+            k.prio))
+  for k in sorted(e.chars()):
+    yield ("INSERT INTO kanji_code VALUES (?,?)", (e.seq, ord(k)))
+  for r in e.reading:
+    yield ("INSERT INTO reading VALUES (?,?,?,?,?,?,?)",
+           (e.seq, r.elem, "\n".join(r.restr), "\n".join(r.info),
+            r.prio, katakana2hiragana(r.elem), kana2romaji(r.elem)))
+  for s in e.sense:
+    yield ("INSERT INTO sense VALUES (?,?,?,?,?,?)",
+           (e.seq, "\n".join(s.pos), s.lang, "\n".join(s.gloss),
+            "\n".join(s.info), "\n".join(s.xref)))
+  for g in elem_bigrams(e.words()):
+    yield ("INSERT INTO ngram VALUES (?,?)", (g, e.seq))
+                                                                # }}}1
+
+# NB: for the ngram index, used to prefilter substring searches
+def elem_bigrams(elems):
+  return sorted(set( g for x in elems for g in M.bigrams(x)
+                       if M.iscjk(g) ))
+
+# NB: only deletes & (re)inserts changed/removed entries; requires an
+# existing DB w/ the current schema; a single transaction (so the
+# derived tables must not use executescript, which COMMITs): if
+# interrupted, nothing changes & the next run sees the same diff
+def jmdict2sqldb_incremental(data, file = SQLITE_FILE):         # {{{1
+  repitch = pitch_rebuilt(file)
+  with sqlite_do(file, write = True) as c:
+    old         = dict(c.execute("SELECT seq, hash FROM entry"))
+    seen, new   = set(), []
+    with click.progressbar(data, width = 0,
+                           label = "diffing jmdict") as bar:
+      for e in bar:
+        seen.add(e.seq)
+        rows = list(entry_rows(e))
+        if old.get(e.seq) != rows[0][1][-1]: new.append((e.seq, rows))
+    stale = [ seq for seq in old if seq not in seen ]
+    delete_entries(c, stale + [ seq for seq, _ in new if seq in old ])
+    insert_rows(c, ( r for _, rows in new for r in rows ))
+    if repitch:
+      c.execute("DELETE FROM pitch")
+      pitch2sqldb(c)
+    else:
+      pitch2sqldb(c, [ seq for seq, _ in new ])
+    if new or stale:
+      sample2sqldb(c, "entry", "seq")
+      complete2sqldb(c)
+      tags2sqldb(c)
+    c.execute("ANALYZE")
+  return len(new), len(stale)
+
+# NB: (re)builds the autocompletion tables from the other tables; terms
+# are kanji, readings, romaji & english glosses; scores are ordered
+# like search results (prio first, then rank)
+def complete2sqldb(c):                                          # {{{1
+  data, score = {}, {}
+  def add(term, word, s):
+    k = (complete_term(term), word)
+    if k[0] and data.get(k, s + 1) > s: data[k] = s
+  for seq, s in c.execute("""
+      SELECT seq, rank + (IFNULL(prio, 0) < ?) * ? FROM entry
+      """, (MINPRIO, F.MAXFREQ)):
+    score[seq] = s
+  for seq, elem in c.execute("SELECT entry, elem FROM kanji"):
+    add(elem, elem, score[seq])
+  for seq, elem, roma in c.execute(
+      "SELECT entry, elem, roma FROM reading"):
+    add(elem, elem, score[seq])
+    add(roma, elem, score[seq])
+  for seq, gloss in c.execute(
+      "SELECT entry, gloss FROM sense WHERE lang = ?", (LANGS[0],)):
+    for g in gloss.splitlines(): add(g, g, score[seq])
+  c.execute("DELETE FROM complete")
+  c.executemany("INSERT INTO complete VALUES (?,?,?)",
+                ( k + (s,) for k, s in data.items() ))
+  for q in JMDICT_COMPLETE_SQL: c.execute(q)
+
+def complete_term(s): return katakana2hiragana(s.strip().lower())
+                                                                # }}}1
+
+# NB: (re)builds the tag tables: the distinct lines of the pos & info
+# of each entry's senses, for search_filter's sinfo (prefix) match
+def tags2sqldb(c):
+  tags, rows = {}, set()
+  for seq, pos, info in c.execute("SELECT entry, pos, info FROM sense"):
+    for t in pos.splitlines() + info.splitlines():
+      if t: rows.add((tags.setdefault(t, len(tags) + 1), seq))
+  c.execute("DELETE FROM entry_tag")
+  c.execute("DELETE FROM tag")
+  c.executemany("INSERT INTO tag VALUES (?,?)",
+                ( (i, t) for t, i in tags.items() ))
+  c.executemany("INSERT INTO entry_tag VALUES (?,?)", sorted(rows))
+
+# NB: the (rendered) pitch accents of all (or the given) entries; the
+# pitch DB must have been built first (see wait); w/o it (the pitch
+# data is optional) the table is left empty (see have_pitch)
+def pitch2sqldb(c, seqs = None):
+  if not os.path.exists(P.SQLITE_FILE):
+    click.secho("no pitch DB, skipping pitch accents.", fg = "yellow")
+    return
+  P.have_pitch.cache_clear()
+  if seqs is None:
+    seqs = [ r[0] for r in c.execute("SELECT seq FROM entry") ]
+  with sqlite_do(P.SQLITE_FILE) as p:
+    for i in range(0, len(seqs), CHUNK_SIZE):
+      chunk = seqs[i:i+CHUNK_SIZE]
+      ents  = load_entries(c, ( (seq, None) for seq in chunk ))
+      c.executemany("INSERT INTO pitch VALUES (?,?,?)", (
+        (seq, n, x) for seq, xs in P.get_pitches(ents, p).items()
+                    for n, x in enumerate(xs)
+      ))
+
+# NB: the pitch table is only updated for changed entries, unless the
+# pitch DB was rebuilt (i.e. is newer) since the jmdict DB was written
+def pitch_rebuilt(file = SQLITE_FILE):
+  try:
+    return os.path.getmtime(P.SQLITE_FILE) > os.path.getmtime(file)
+  except OSError:
+    return False
+
+# NB: ngram rows are deleted by key (computed from the old elems)
+def delete_entries(c, seqs):
+  for i in range(0, len(seqs), MAXVARS):
+    chunk = seqs[i:i+MAXVARS]
+    ps    = ",".join("?" * len(chunk))
+    elems = {}
+    for t in "kanji reading".split():
+      q = f"SELECT entry, elem FROM {t} WHERE entry IN ({ps})" # safe!
+      for seq, elem in c.execute(q, chunk):
+        elems.setdefault(seq, []).append(elem)
+    c.executemany("DELETE FROM ngram WHERE gram = ? AND entry = ?",
+                  ( (g, seq) for seq, xs in elems.items()
+                             for g in elem_bigrams(xs) ))
+    for t in "kanji kanji_code reading sense pitch".split():
+      c.execute(f"DELETE FROM {t} WHERE entry IN ({ps})", chunk) # safe!
+    c.execute(f"DELETE FROM entry WHERE seq IN ({ps})", chunk) # safe!
                                                                 # }}}1
 
                                                                 # {{{1
@@ -526,6 +827,13 @@ JMDICT_CREATE_SQL = """
   DROP TABLE IF EXISTS kanji_code;
   DROP TABLE IF EXISTS reading;
   DROP TABLE IF EXISTS sense;
+  DROP TABLE IF EXISTS sense_fts;
+  DROP TABLE IF EXISTS ngram;
+  DROP TABLE IF EXISTS complete;
+  DROP TABLE IF EXISTS complete_top;
+  DROP TABLE IF EXISTS pitch;
+  DROP TABLE IF EXISTS tag;
+  DROP TABLE IF EXISTS entry_tag;
   DROP TABLE IF EXISTS version;
 
   CREATE TABLE entry(
@@ -535,7 +843,8 @@ JMDICT_CREATE_SQL = """
     freq INTEGER,
     prio INTEGER,
     noun BOOLEAN,
-    verb BOOLEAN
+    verb BOOLEAN,
+    hash TEXT
   );
   CREATE TABLE kanji(
     entry INTEGER,
@@ -556,6 +865,8 @@ JMDICT_CREATE_SQL = """
     restr TEXT,
     info TEXT,
     prio INTEGER,
+    hira TEXT,
+    roma TEXT,
     FOREIGN KEY(entry) REFERENCES entry(seq)
   );
   CREATE TABLE sense(
@@ -567,33 +878,128 @@ JMDICT_CREATE_SQL = """
     xref TEXT,
     FOREIGN KEY(entry) REFERENCES entry(seq)
   );
+  CREATE TABLE ngram(
+    gram TEXT,
+    entry INTEGER,
+    PRIMARY KEY(gram, entry),
+    FOREIGN KEY(entry) REFERENCES entry(seq)
+  ) WITHOUT ROWID;
+  CREATE TABLE complete(
+    term TEXT,
+    word TEXT,
+    score INTEGER,
+    PRIMARY KEY(term, word)
+  ) WITHOUT ROWID;
+  CREATE TABLE complete_top(
+    prefix TEXT,
+    n INTEGER,
+    word TEXT,
+    PRIMARY KEY(prefix, n)
+  ) WITHOUT ROWID;
+  CREATE TABLE pitch(
+    entry INTEGER,
+    n INTEGER,
+    pitch TEXT,
+    PRIMARY KEY(entry, n),
+    FOREIGN KEY(entry) REFERENCES entry(seq)
+  ) WITHOUT ROWID;
+  CREATE TABLE tag(
+    id INTEGER PRIMARY KEY ASC,
+    name TEXT UNIQUE
+  );
+  CREATE TABLE entry_tag(
+    tag INTEGER,
+    entry INTEGER,
+    PRIMARY KEY(tag, entry),
+    FOREIGN KEY(tag) REFERENCES tag(id),
+    FOREIGN KEY(entry) REFERENCES entry(seq)
+  ) WITHOUT ROWID;
   CREATE TABLE version(
     version INTEGER
   );
+"""
 
+JMDICT_INDEX_SQL = """
   CREATE INDEX idx_kanji ON kanji (entry);
   CREATE INDEX idx_kanji_code ON kanji_code (code);
   CREATE INDEX idx_reading ON reading (entry);
+  CREATE INDEX idx_reading_hira ON reading (hira);
+  CREATE INDEX idx_reading_roma ON reading (roma);
   CREATE INDEX idx_sense ON sense (entry);
+  CREATE INDEX idx_entry_rank ON entry (rank, seq, jlpt)
+    WHERE prio >= {0};
+  CREATE INDEX idx_entry_jlpt ON entry (jlpt, rank, seq)
+    WHERE prio >= {0};
+""".format(MINPRIO)
+
+# NB: the top COMPLETE_MAX words for each prefix of up to COMPLETE_TOP
+# chars, which would otherwise match too many terms; separate
+# statements (see jmdict2sqldb_incremental)
+JMDICT_COMPLETE_SQL = ("DELETE FROM complete_top", """
+  INSERT INTO complete_top
+    SELECT prefix, n, word FROM (
+      SELECT prefix, word, ROW_NUMBER() OVER (
+        PARTITION BY prefix ORDER BY MIN(score) ASC, word ASC
+      ) AS n FROM ({}) GROUP BY prefix, word
+    ) WHERE n <= {}
+""".format(" UNION ALL ".join(
+  "SELECT substr(term, 1, {0}) AS prefix, word, score FROM complete "
+  "WHERE length(term) >= {0}".format(n)
+  for n in range(1, COMPLETE_TOP+1)
+), COMPLETE_MAX))                                               # safe!
+
+# NB: external content table w/ trigram index of sense.gloss; the
+# trigram tokenizer supports (case-insensitive) LIKE w/ the index;
+# the triggers keep it in sync for incremental updates
+JMDICT_FTS_SQL = """
+  CREATE VIRTUAL TABLE sense_fts USING fts5(
+    gloss,
+    entry UNINDEXED,
+    lang UNINDEXED,
+    content = 'sense',
+    tokenize = 'trigram'
+  );
+  INSERT INTO sense_fts (sense_fts) VALUES ('rebuild');
+
+  CREATE TRIGGER sense_fts_ai AFTER INSERT ON sense BEGIN
+    INSERT INTO sense_fts (rowid, gloss, entry, lang)
+      VALUES (new.rowid, new.gloss, new.entry, new.lang);
+  END;
+  CREATE TRIGGER sense_fts_ad AFTER DELETE ON sense BEGIN
+    INSERT INTO sense_fts (sense_fts, rowid, gloss, entry, lang)
+      VALUES ('delete', old.rowid, old.gloss, old.entry, old.lang);
+  END;
 """                                                             # }}}1
 
+# NB: a DB w/o a version row (e.g. from an interrupted build) is out
+# of date
 def up2date(file = SQLITE_FILE):
   if os.path.exists(file):
     with sqlite_do(file) as c:
-      if c.execute("SELECT name FROM sqlite_master WHERE" +
-                   " type = 'table' AND name = 'version'").fetchone():
-        v = c.execute("SELECT version FROM version").fetchone()[0]
-        if v == DBVERSION: return True
+      if have_table(c.connection, "version"):
+        r = c.execute("SELECT version FROM version").fetchone()
+        if r and r[0] == DBVERSION: return True
   return False
 
-def setup(file = SQLITE_FILE):                                  # {{{1
+# NB: when using a pool, wait() is called before writing the version
+# (which marks the DBs as up to date) & before the new DB replaces the
+# old one (see sqlite_bulk), so a failed worker leaves the old DB (or
+# none) in place; incremental only updates
+# changed entries (if the DB is up to date, i.e. has the same schema)
+def setup(file = SQLITE_FILE, pool = None, wait = None,         # {{{1
+          incremental = False):
   F.setup()
-  jmdict = parse_jmdict()
-  jmdict2sqldb(jmdict, file)
+  data = iter_jmdict_parallel(pool) if pool else iter_jmdict()
+  if incremental and up2date(file):
+    n, m = jmdict2sqldb_incremental(data, file)
+    click.echo("{} entries (re)inserted, {} deleted.".format(n, m))
+    if wait: wait()
+  else:
+    jmdict2sqldb(data, file, wait)
                                                                 # }}}1
 
 # TODO: sinfo vs langs
-def search_filter(noun, verb, prio, jlpt, sinfo):
+def search_filter(noun, verb, prio, jlpt, sinfo, prefix = "WHERE"):
   if not any([noun, verb, prio, jlpt, sinfo]): return ""
   s = []
   if noun and verb: s.append("(noun = 1 OR verb = 1)")
@@ -603,35 +1009,46 @@ def search_filter(noun, verb, prio, jlpt, sinfo):
   if jlpt         : s.append("({} <= jlpt AND jlpt <= {})"
                              .format(*map(int, jlpt)))
   if sinfo:
-    s.append("1 IN (SELECT 1 FROM sense WHERE entry = seq AND "
-                      "(INSTR(pos ,             :si) = 1 OR"
-                      " INSTR(pos , CHAR(10) || :si) > 0 OR"
-                      " INSTR(info,             :si) = 1 OR"
-                      " INSTR(info, CHAR(10) || :si) > 0))")
-  return "WHERE " + " AND ".join(s)
-
-def load_entry(c, seq, jlpt):                                   # {{{1
-  k = tuple(
-      Kanji(r["elem"], frozenset(r["chars"]),
-            tuple(r["info"].splitlines()), r["prio"])
-    for r in c.execute("SELECT * FROM kanji WHERE entry = ?" +
-                       " ORDER BY rowid ASC", (seq,))
-  )
-  r = tuple(
-      Reading(r["elem"], tuple(r["restr"].splitlines()),
-              tuple(r["info"].splitlines()), r["prio"])
-    for r in c.execute("SELECT * FROM reading WHERE entry = ?" +
-                       " ORDER BY rowid ASC", (seq,))
-  )
-  s = tuple(
-      Sense(tuple(r["pos"].splitlines()), r["lang"],
-            tuple(r["gloss"].splitlines()),
-            tuple(r["info"].splitlines()),
-            tuple(r["xref"].splitlines()))
-    for r in c.execute("SELECT * FROM sense WHERE entry = ?" +
-                       " ORDER BY rowid ASC", (seq,))
-  )
-  return Entry(seq, jlpt, *(k, r, s))
+    s.append("seq IN (SELECT entry FROM entry_tag WHERE tag IN "
+                     "(SELECT id FROM tag WHERE name >= :si AND "
+                     " name < :si || CHAR(1114111)))")    # prefix
+  return prefix + " " + " AND ".join(s)
+
+def load_entry(c, seq, jlpt):
+  return next(load_entries(c, [(seq, jlpt)]))
+
+# NB: loads the kanji/readings/senses of (up to) MAXVARS entries per
+# query; entries are yielded in the order given
+def load_entries(c, ents):                                      # {{{1
+  ents = list(ents)
+  for i in range(0, len(ents), MAXVARS):
+    chunk = ents[i:i+MAXVARS]
+    seqs  = [ seq for seq, _ in chunk ]
+    k, r, s = [ _load_elems(c, t, f, seqs) for t, f in LOAD_ELEMS ]
+    for seq, jlpt in chunk:
+      elems = ( tuple(x.get(seq, ())) for x in (k, r, s) )
+      yield Entry(seq, jlpt, *elems)
+
+def _load_elems(c, table, f, seqs):
+  data, ps = {}, ",".join("?" * len(seqs))
+  for r in c.execute(f"SELECT * FROM {table} WHERE entry IN ({ps})" +
+                     " ORDER BY rowid ASC", seqs):            # safe!
+    data.setdefault(r["entry"], []).append(f(r))
+  return data
+
+LOAD_ELEMS = (
+  ("kanji"  , lambda r: Kanji(r["elem"], frozenset(r["chars"]),
+                              tuple(r["info"].splitlines()),
+                              r["prio"])),
+  ("reading", lambda r: Reading(r["elem"],
+                                tuple(r["restr"].splitlines()),
+                                tuple(r["info"].splitlines()),
+                                r["prio"])),
+  ("sense"  , lambda r: Sense(tuple(r["pos"].splitlines()), r["lang"],
+                              tuple(r["gloss"].splitlines()),
+                              tuple(r["info"].splitlines()),
+                              tuple(r["xref"].splitlines()))),
+)
                                                                 # }}}1
 
 # TODO
@@ -650,97 +1067,193 @@ def search(q, langs = [LANGS[0]], max_results = None,           # {{{1
     elif "幸猫" in q:
       yield SACHINEKO, None
     else:
-      lang  = ",".join( "'" + l + "'" for l in langs if l in LANGS )
-      limit = "LIMIT " + str(int(max_results)) if max_results else ""
-      fltr  = search_filter(noun, verb, prio, jlpt, sinfo)
-      ordr  = """ORDER BY IFNULL(prio, 0) >= {} DESC,
-                          rank = {} ASC, prio IS NULL ASC,
-                          rank ASC, jlpt DESC, prio DESC, seq ASC
-              """.format(MINPRIO, F.NOFREQ)                     # TODO
-      if len(q) == 1 and M.iskanji(q):
-        query = ("""
-          SELECT rank, seq, jlpt FROM (
-            SELECT entry FROM kanji_code WHERE code = :q
-          )
-          INNER JOIN entry ON seq = entry
-          {} {} {}
-        """.format(fltr, ordr, limit),
-          dict(q = ord(q), si = sinfo))                       # safe!
-      elif M.iscjk(q):
-        query = ("""
-          SELECT rank, seq, jlpt FROM (
-              SELECT entry FROM kanji WHERE elem LIKE :q
-            UNION
-              SELECT entry FROM reading WHERE elem LIKE :q
-          )
-          INNER JOIN entry ON seq = entry
-          {} {} {}
-        """.format(fltr, ordr, limit),
-          dict(q = "%"+q+"%", si = sinfo))                    # safe!
-      elif M.q2like(q):
-        load_pcre_extension(c.connection)
-        prms  = dict(q = M.q2like(q), re = M.q2rx(q), si = sinfo)
-        query = ("""
-          SELECT rank, seq, jlpt FROM (
-              SELECT entry FROM kanji WHERE
-                elem LIKE :q AND elem REGEXP :re
-            UNION
-              SELECT entry FROM reading WHERE
-                elem LIKE :q AND elem REGEXP :re
-        """ + ("" if M.iscjk(M.without_e1w(q)) else """
-            UNION
-              SELECT entry FROM sense WHERE
-                lang IN ({}) AND gloss LIKE :q AND gloss REGEXP :re
-        """.format(lang)) + """
-          )
-          INNER JOIN entry ON seq = entry
-          {} {} {}
-        """.format(fltr, ordr, limit), prms)                  # safe!
+      key   = (q, tuple(langs), max_results, noun, verb, prio, jlpt,
+               sinfo)
+      if (rows := CACHE.get(file, key)) is None:
+        query = search_query(c, q, langs, max_results, noun, verb, prio,
+                             jlpt, sinfo)
+        rows  = [ tuple(r) for r in c.execute(*query) ]       # eager!
+        CACHE.put(file, key, rows)
+      ents = load_entries(c, ( (s, j) for _, s, j in rows ))
+      for (r, _, _), e in zip(rows, ents):
+        yield e, fix_rank(r)
+                                                                # }}}1
+
+# NB: returns the query (& params) for search()
+def search_query(c, q, langs, max_results, noun, verb, prio, jlpt,
+                 sinfo):                                        # {{{1
+  lang  = ",".join( "'" + l + "'" for l in langs if l in LANGS )
+  limit = "LIMIT " + str(int(max_results)) if max_results else ""
+  fltr  = search_filter(noun, verb, prio, jlpt, sinfo)
+  ordr  = """ORDER BY IFNULL(prio, 0) >= {} DESC,
+                      rank = {} ASC, prio IS NULL ASC,
+                      rank ASC, jlpt DESC, prio DESC, seq ASC
+          """.format(MINPRIO, F.NOFREQ)                         # TODO
+  if len(q) == 1 and M.iskanji(q):
+    query = ("""
+      SELECT rank, seq, jlpt FROM (
+        SELECT entry FROM kanji_code WHERE code = :q
+      )
+      INNER JOIN entry ON seq = entry
+      {} {} {}
+    """.format(fltr, ordr, limit),
+      dict(q = ord(q), si = sinfo))                           # safe!
+  elif M.iscjk(q):
+    cte, cand, gprm = _ngram_cand(q)
+    query = ("""
+      {cte}
+      SELECT rank, seq, jlpt FROM (
+          SELECT entry FROM kanji WHERE elem LIKE :q {cand}
+        UNION
+          SELECT entry FROM reading WHERE elem LIKE :q {cand}
+      )
+      INNER JOIN entry ON seq = entry
+      {fltr} {ordr} {limit}
+    """.format(cte = cte, cand = cand, fltr = fltr, ordr = ordr,
+               limit = limit),
+      dict(q = "%"+q+"%", si = sinfo, **gprm))                # safe!
+  elif M.q2like(q):
+    # NB: LIKE is exact for literal queries, no need for REGEXP
+    if M.isliteral(q):
+      rx = ""
+    else:
+      load_pcre_extension(c.connection)
+      rx = "AND {} REGEXP :re"
+    sens  = "sense_fts" if _have_fts(c) else "sense"
+    cte, cand, gprm = _ngram_cand(M.q2like(q))
+    prms  = dict(q = M.q2like(q), re = M.q2rx(q), si = sinfo, **gprm)
+    # NB: exact & first word kana matches find their candidates using
+    # the (hiragana-folded) reading index, an equality or prefix query,
+    # but still match elem itself, so they remain script-sensitive
+    if q[:2] in ("+=", "+1") and M.iskana(M.without_e1w(q)):
+      key   = katakana2hiragana(elem := M.without_e1w(q))
+      if q.startswith("+="):
+        read = "hira = :hira AND elem = :elem"
       else:
         load_pcre_extension(c.connection)
-        query = ("""
-          SELECT rank, seq, jlpt FROM (
-              SELECT entry FROM kanji WHERE elem REGEXP :re
-            UNION
-              SELECT entry FROM reading WHERE elem REGEXP :re
-            UNION
-              SELECT entry FROM sense WHERE
-                lang IN ({}) AND gloss REGEXP :re
-          )
-          INNER JOIN entry ON seq = entry
-          {} {} {}
-        """.format(lang, fltr, ordr, limit),
-          dict(re = M.q2rx(q), si = sinfo))                   # safe!
-      for r, s, j in [ tuple(r) for r in c.execute(*query) ]: # eager!
-        yield load_entry(c, s, j), fix_rank(r)
+        read = "hira >= :hira AND hira < :succ AND elem REGEXP :re"
+      prms.update(hira = key, succ = _succ(key), elem = elem)
+    else:
+      read  = "elem LIKE :q {cand} {elem_rx}"
+    query = ("""
+      {cte}
+      SELECT rank, seq, jlpt FROM (
+          SELECT entry FROM kanji WHERE
+            elem LIKE :q {cand} {elem_rx}
+        UNION
+          SELECT entry FROM reading WHERE """ + read + """
+    """ + ("" if M.iscjk(M.without_e1w(q)) else """
+        UNION
+          SELECT entry FROM {sens} WHERE
+            gloss LIKE :q AND lang IN ({lang}) {gloss_rx}
+    """) + """
+      )
+      INNER JOIN entry ON seq = entry
+      {fltr} {ordr} {limit}
+    """).format(elem_rx = rx.format("elem"),
+                 gloss_rx = rx.format("gloss"),
+                 sens = sens, lang = lang, fltr = fltr, ordr = ordr,
+                 limit = limit, cte = cte, cand = cand), prms # safe!
+  else:
+    load_pcre_extension(c.connection)
+    query = ("""
+      SELECT rank, seq, jlpt FROM (
+          SELECT entry FROM kanji WHERE elem REGEXP :re
+        UNION
+          SELECT entry FROM reading WHERE elem REGEXP :re
+        UNION
+          SELECT entry FROM sense WHERE
+            lang IN ({}) AND gloss REGEXP :re
+      )
+      INNER JOIN entry ON seq = entry
+      {} {} {}
+    """.format(lang, fltr, ordr, limit),
+      dict(re = M.q2rx(q), si = sinfo))                       # safe!
+  return query
                                                                 # }}}1
 
-def by_freq(offset = 0, limit = 1000, *, file = SQLITE_FILE):
+# NB: words (kanji, readings & english glosses) w/ terms starting w/
+# the query (folded to lowercase & hiragana), best first
+def complete(q, max_results = COMPLETE_MAX, *, file = SQLITE_FILE):
+  term = complete_term(q)
+  if not term: return []
+  with sqlite_do(file) as c:
+    if len(term) <= COMPLETE_TOP and max_results <= COMPLETE_MAX:
+      rows = c.execute("""
+        SELECT word FROM complete_top WHERE prefix = ?
+          ORDER BY n ASC LIMIT ?
+      """, (term, max_results))
+    else:
+      rows = c.execute("""
+        SELECT word FROM complete WHERE term >= ? AND term < ?
+          GROUP BY word ORDER BY MIN(score) ASC, word ASC LIMIT ?
+      """, (term, _succ(term), max_results))
+    return [ r[0] for r in rows ]
+
+
+# NB: (for prefix ranges) a string > all strings starting w/ s, except
+# those w/ U+10FFFF (a noncharacter) right after s
+def _succ(s):
+  t = s.rstrip("\U0010ffff")
+  return t[:-1] + chr(ord(t[-1]) + 1) if t else s + "\U0010ffff"
+
+# NB: candidate entries (from the ngram index) that contain all CJK
+# bigrams of the LIKE pattern; no filter if it has none
+def _ngram_cand(pattern):
+  grams = M.like_bigrams(pattern)[:MAXGRAMS]
+  if not grams: return "", "", {}
+  sel   = " INTERSECT ".join(
+            "SELECT entry FROM ngram WHERE gram = :g{}".format(i)
+            for i in range(len(grams)) )
+  return ("WITH cand(entry) AS ({})".format(sel), "AND entry IN cand",
+          { "g{}".format(i): g for i, g in enumerate(grams) })
+
+def _have_fts(c):
+  conn = c.connection
+  return have_fts5(conn) and have_table(conn, "sense_fts")
+
+def by_freq(offset = 0, limit = 1000, *, after = None, before = None,
+            file = SQLITE_FILE):
   with sqlite_do(file) as c:
-    q = """ SELECT seq, rank, jlpt FROM entry
-              WHERE prio >= {} AND rank != {}
-              ORDER BY rank ASC LIMIT ? OFFSET ?
-        """.format(MINPRIO, F.NOFREQ)                         # safe!
-    ents = [ tuple(r) for r in c.execute(q, (int(limit), int(offset))) ]
-    for seq, rank, jlpt in ents:
-      yield load_entry(c, seq, jlpt), rank
-
-def by_jlpt(n, offset = 0, limit = 1000, *, file = SQLITE_FILE):
+    cond = "rank != {}".format(F.NOFREQ)
+    rows = by_rank(c, cond, (), offset, limit, after, before)
+    ents = load_entries(c, ( (seq, jlpt) for seq, _, jlpt in rows ))
+    for (_, rank, _), e in zip(rows, ents):
+      yield e, rank
+
+def by_jlpt(n, offset = 0, limit = 1000, *, after = None, before = None,
+            file = SQLITE_FILE):
   with sqlite_do(file) as c:
-    query =  (""" SELECT seq, jlpt FROM entry
-                    WHERE prio >= {} AND jlpt = ?
-                    ORDER BY rank ASC LIMIT ? OFFSET ?
-              """.format(MINPRIO), (int(n), int(limit), int(offset)))
-    for seq, jlpt in [ tuple(r) for r in c.execute(*query) ]:
-      yield load_entry(c, seq, jlpt)
+    rows = by_rank(c, "jlpt = ?", (int(n),), offset, limit, after,
+                   before)
+    yield from load_entries(c, ( (seq, jlpt) for seq, _, jlpt in rows ))
+
+# NB: after/before are the seq of the entry preceding/following the
+# page (keyset pagination, using idx_entry_{rank,jlpt}); offset is only
+# used w/o either
+def by_rank(c, cond, args, offset, limit, after, before):
+  cur, order = "", "ASC"
+  if after is not None or before is not None:
+    seq, offset = after if after is not None else before, 0
+    cur   = """AND (rank, seq) {} (SELECT rank, seq FROM entry
+                                    WHERE seq = ?)""".format(
+              ">" if after is not None else "<")
+    args  = args + (int(seq),)
+    if after is None: order = "DESC"
+  q = """ SELECT seq, rank, jlpt FROM entry
+            WHERE prio >= {} AND {} {}
+            ORDER BY rank {o}, seq {o} LIMIT ? OFFSET ?
+      """.format(MINPRIO, cond, cur, o = order)               # safe!
+  rows = [ tuple(r) for r in
+           c.execute(q, args + (int(limit), int(offset))) ]
+  return rows[::-1] if order == "DESC" else rows
 
 def random_seq(noun = False, verb = False, prio = False, jlpt = None,
                sinfo = None, *, file = SQLITE_FILE):
-  f = search_filter(noun, verb, prio, jlpt, sinfo)
+  f = search_filter(noun, verb, prio, jlpt, sinfo, "AND")
   with sqlite_do(file) as c:
-    q = "SELECT seq FROM entry {} ORDER BY RANDOM() LIMIT 1".format(f)
-    r = c.execute(q, dict(si = sinfo)).fetchone()           # ^ safe!
-    return None if r is None else r[0]
+    r = random_keys(c, "entry", "seq", f, dict(si = sinfo))
+    return r[0] if r else None
 
 SACHINEKO = Entry(
   29483, None,
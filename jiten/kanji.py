@@ -116,19 +116,77 @@ True
 >>> len([ kana2romaji(r) for e in kanjidic for r in e.nanori ])
 3465
 
+>>> kmod = sys.modules[search.__module__]
+>>> def both(f, *a, **kw):
+...   kmod.MEMORY = False; x = list(f(*a, **kw))
+...   kmod.MEMORY = True;  y = list(f(*a, **kw))
+...   kmod.MEMORY = False
+...   return x == y or (x, y)
+>>> qs = ["猫日本", "+s1-3-8", "+skip 2-4-4", "+r 口木", "+r 忄", "+r ア"]
+>>> fs = [dict(), dict(level = (0, 3)), dict(jlpt = (2, 4)),
+...       dict(strokes = (5, 9))]
+>>> all( both(search, q, m, **f) is True
+...      for q in qs for f in fs for m in (None, 3) )
+True
+>>> [ both(f) for f in (by_freq, by_jlpt, lambda: by_level("常用1"),
+...                     lambda: by_skip(1), lambda: by_skip(4)) ]
+[True, True, True, True, True]
+>>> def rms(chars = "猫日a"):
+...   with readmeans() as lookup: return [ lookup(c) for c in chars ]
+>>> both(rms)
+True
+>>> kmod.MEMORY = True
+>>> random(jlpt = (5, 5)).new_jlpt, random(strokes = (99, 99))
+(5, None)
+>>> kmod.MEMORY = False
+
+>>> def isct(rads, level = None, jlpt = None, strokes = None,
+...          limit = None):
+...   fltr = search_filter(level, jlpt, strokes)[0]
+...   lim  = f"LIMIT {limit}" if limit else ""
+...   q    = " INTERSECT ".join(
+...            "SELECT entry FROM comp WHERE code = ?" for _ in rads )
+...   with sqlite_do(SQLITE_FILE) as c:
+...     return [ r["char"] for r in c.execute(f'''
+...              SELECT entry.* FROM ({q})
+...              INNER JOIN entry ON code = entry
+...              {fltr} {ORDER} {lim}''', [ ord(r) for r in rads ]) ]
+>>> def rsearch(rads, limit = None, **f):
+...   return [ e.char for e in search("+r " + rads, limit, **f) ]
+>>> rs = ["口木", "⺡", "忄", "ア", "口木⽇", "⻖", "⽔⽕⼟"]
+>>> all( rsearch(q, m, **f) == isct(radicals(q), limit = m, **f)
+...      for q in rs for f in fs for m in (None, 3) )
+True
+>>> def picks(q):
+...   rads = radicals(q)
+...   return "".join( r for g in RADTABLE for r, _ in g
+...                   if isct(rads + [VAR2RAD.get(r, r)], limit = 1) )
+>>> all( radical_candidates(q)[2] == picks(q)
+...      for q in ["", "口", "口木"] )
+True
+>>> kanji, count, _ = radical_candidates("口木", 5)
+>>> list(kanji) == isct(radicals("口木"), limit = 5)
+True
+>>> count == len(isct(radicals("口木")))
+True
+
 """                                                             # }}}1
 
-import gzip, itertools, re, sys, unicodedata as UD
-import xml.etree.ElementTree as ET
+import functools, gzip, itertools, os, re, sys, threading
+import unicodedata as UD
 
 from collections import namedtuple
+from random import choice
 from contextlib import contextmanager
 
 import click
 
 from . import jmdict as J
 from . import misc   as M
-from .sql import sqlite_do, load_pcre_extension
+from .sql import sqlite_do, sqlite_bulk, insert_rows, \
+                 load_pcre_extension, register_function, \
+                 ResultCache, sample2sqldb, random_keys, \
+                 cache_ident, SAMPLE_TRIES
 
 SQLITE_FILE     = M.resource_path("res/kanji.sqlite3")
 KANJIDIC_FILE   = M.resource_path("res/jmdict/kanjidic2.xml.gz")
@@ -139,7 +197,14 @@ DATA_FILES      = (SQLITE_FILE, KANJIDIC_FILE, KANJIVG_FILE, KRADFILE)
 
 MAXE   = 25                                                     # TODO
 NOFREQ = 9999
+CACHE  = ResultCache("kanji", J.DBVERSION)
+RMS    = ResultCache("readmean", J.DBVERSION, size = 4096,
+                     shared = None)
+RMSN   = 50                                      # NB: results per query
+MEMORY = bool(os.environ.get("JITEN_KANJI_MEMORY"))   # NB: see Store
 LEVELS = "常用1 常用2 常用3 常用4 常用5 常用6 常用 人名 人名(常用)".split()
+ORDER  = """ORDER BY IFNULL(freq, {}) ASC, level2int(level) ASC,
+            code ASC""".format(NOFREQ)                          # safe!
 
 Entry = namedtuple("Entry", """
   char cat level strokes freq jlpt new_jlpt skip rad comp var
@@ -172,6 +237,8 @@ def level2int(l):
   except ValueError:
     return 99
 
+register_function("level2int", 1, level2int)
+
 def category(c):
   if M.iskanji(c) : return "KANJI"
   if M.iscompat(c): return "CJK COMPATIBILITY IDEOGRAPH"
@@ -199,51 +266,55 @@ def maybe(x, f, d = None):
 
 # TODO
 # * rmgroup?!
-def parse_kanjidic(kanjivg = None, file = KANJIDIC_FILE):       # {{{1
+def parse_kanjidic(kanjivg = None, file = KANJIDIC_FILE):
+  with click.progressbar(iter_kanjidic(kanjivg, file), width = 0,
+                         label = "parsing kanjidic") as bar:
+    return list(bar)
+
+# NB: streaming, does not keep the whole DOM in memory
+def iter_kanjidic(kanjivg = None, file = KANJIDIC_FILE):
   if kanjivg is None: kanjivg = parse_kanjivg()
-  data = []
   with gzip.open(file) as f:
-    with click.progressbar(ET.parse(f).getroot(), width = 0,
-                           label = "parsing kanjidic") as bar:
-      for e in bar:
-        if e.tag != "character": continue
-        char    = e.find("literal").text.strip()
-        lvl     = maybe(e.find(".//grade"), lambda e: level(int(e.text)))
-        strokes = int(e.find(".//stroke_count").text)
-        freq    = maybe(e.find(".//freq"), lambda e: int(e.text))
-        jlpt    = maybe(e.find(".//jlpt"), lambda e: int(e.text)) # *OLD* JLPT (1-4)
-        skip    = maybe(e.find(".//q_code[@qc_type='skip']"),
-                        lambda e: e.text.strip())
-        rad     = int(e.find(".//rad_value[@rad_type='classical']").text)
-        comp    = kanjivg.get(char, set())
-        var_    = set(variants(char, e.findall(".//variant")))
-        var     = "".join(sorted(var_ - set([char, canonical(char)])))
-        on      = tuple( r.text.strip() for r in
-                         e.findall(".//reading[@r_type='ja_on']") )
-        kun     = tuple( r.text.strip() for r in
-                         e.findall(".//reading[@r_type='ja_kun']") )
-        nanori  = tuple( n.text.strip() for n in e.findall(".//nanori") )
-        meaning = tuple( m.text.strip() for m in e.findall(".//meaning")
-                                        if m.get("m_lang") is None )
-        if comp and not set(RADICALS[rad-1]).issubset(comp):
-          for x, y in "肉⽉ 白⽇ 曰⽇ 臼𦥑 匸⼕ 夊⼡ 夂久 人⼊ 入⼈ 釆采".split():
-            if x == RADICALS[rad-1][1] and y in comp: break
-          else:
-            assert char in "巨尭之冒丗关"
-        comp = "".join(sorted(comp | set(RADICALS[rad-1] + char)))
-        assert len(char) == 1
-        assert 1 <= rad <= 214
-        assert all( M.iskatakana(c) or c in ".-" for x in on for c in x )
-        assert all( all( M.ishiragana(c) or c in ".-ー" for c in x ) or
-                         M.iskatakana(x) for x in kun )
-        assert all( "\n" not in x for x in on )
-        assert all( "\n" not in x for x in kun )
-        assert all( "\n" not in x for x in nanori )
-        assert all( "\n" not in x for x in meaning )
-        data.append(Entry(char, category(char), lvl, strokes, freq,
-                          jlpt, JLPT.get(char), skip, rad, comp, var,
-                          on, kun, nanori, meaning))
-      return data
+    for e in M.iterparse(f, "character"):
+      yield parse_character(e, kanjivg)
+
+def parse_character(e, kanjivg):                                # {{{1
+  char    = e.find("literal").text.strip()
+  lvl     = maybe(e.find(".//grade"), lambda e: level(int(e.text)))
+  strokes = int(e.find(".//stroke_count").text)
+  freq    = maybe(e.find(".//freq"), lambda e: int(e.text))
+  jlpt    = maybe(e.find(".//jlpt"), lambda e: int(e.text)) # *OLD* JLPT (1-4)
+  skip    = maybe(e.find(".//q_code[@qc_type='skip']"),
+                  lambda e: e.text.strip())
+  rad     = int(e.find(".//rad_value[@rad_type='classical']").text)
+  comp    = kanjivg.get(char, set())
+  var_    = set(variants(char, e.findall(".//variant")))
+  var     = "".join(sorted(var_ - set([char, canonical(char)])))
+  on      = tuple( r.text.strip() for r in
+                   e.findall(".//reading[@r_type='ja_on']") )
+  kun     = tuple( r.text.strip() for r in
+                   e.findall(".//reading[@r_type='ja_kun']") )
+  nanori  = tuple( n.text.strip() for n in e.findall(".//nanori") )
+  meaning = tuple( m.text.strip() for m in e.findall(".//meaning")
+                                  if m.get("m_lang") is None )
+  if comp and not set(RADICALS[rad-1]).issubset(comp):
+    for x, y in "肉⽉ 白⽇ 曰⽇ 臼𦥑 匸⼕ 夊⼡ 夂久 人⼊ 入⼈ 釆采".split():
+      if x == RADICALS[rad-1][1] and y in comp: break
+    else:
+      assert char in "巨尭之冒丗关"
+  comp = "".join(sorted(comp | set(RADICALS[rad-1] + char)))
+  assert len(char) == 1
+  assert 1 <= rad <= 214
+  assert all( M.iskatakana(c) or c in ".-" for x in on for c in x )
+  assert all( all( M.ishiragana(c) or c in ".-ー" for c in x ) or
+                   M.iskatakana(x) for x in kun )
+  assert all( "\n" not in x for x in on )
+  assert all( "\n" not in x for x in kun )
+  assert all( "\n" not in x for x in nanori )
+  assert all( "\n" not in x for x in meaning )
+  return Entry(char, category(char), lvl, strokes, freq, jlpt,
+               load_jlpt().get(char), skip, rad, comp, var, on, kun,
+               nanori, meaning)
                                                                 # }}}1
 
 # NB: kanjivg & kradfile
@@ -251,8 +322,7 @@ def parse_kanjivg(file = KANJIVG_FILE, kradfile = KRADFILE):    # {{{1
   elem = "{http://kanjivg.tagaini.net}element"
   data = {}
   with gzip.open(file) as f:
-    for e in ET.parse(f).getroot():
-      if e.tag != "kanji": continue
+    for e in M.iterparse(f, "kanji"):
       code  = int(e.get("id").replace("kvg:kanji_", ""), 16)
       char  = chr(code)
       elems = set( r.get(elem) for r in e.findall(".//g")
@@ -280,6 +350,8 @@ def parse_kanjivg(file = KANJIVG_FILE, kradfile = KRADFILE):    # {{{1
   return data
                                                                 # }}}1
 
+# NB: only needed for setup; loaded (once) on first use
+@functools.lru_cache(maxsize = None)
 def load_jlpt(base = JLPT_FILE_BASE):
   data = {}
   for level in "12345":
@@ -290,21 +362,23 @@ def load_jlpt(base = JLPT_FILE_BASE):
         data[c] = int(level)
   return data
 
-JLPT = load_jlpt()
-
 def kanjidic2sqldb(data, file = SQLITE_FILE):                   # {{{1
-  with sqlite_do(file, write = True) as c:
+  with sqlite_bulk(file) as c:
     c.executescript(KANJIDIC_CREATE_SQL)
     with click.progressbar(data, width = 0, label = "writing kanjidic") as bar:
-      for e in bar:
-        c.execute("INSERT INTO entry VALUES ({})"
-                  .format(",".join("?"*(len(Entry._fields)+1))),
-                  (ord(e.char), e.char, e.cat, e.level, e.strokes,
-                   e.freq, e.jlpt, e.new_jlpt, e.skip, e.rad, e.comp,
-                   e.var, "\n".join(e.on), "\n".join(e.kun),
-                   "\n".join(e.nanori), "\n".join(e.meaning)))
-        for k in e.comp:
-          c.execute("INSERT INTO comp VALUES(?,?)", (ord(e.char), ord(k)))
+      insert_rows(c, ( r for e in bar for r in entry_rows(e) ))
+    c.executescript(KANJIDIC_INDEX_SQL)
+    sample2sqldb(c, "entry", "code")
+
+def entry_rows(e):
+  yield ("INSERT INTO entry VALUES ({})"
+         .format(",".join("?"*(len(Entry._fields)+1))),
+         (ord(e.char), e.char, e.cat, e.level, e.strokes, e.freq,
+          e.jlpt, e.new_jlpt, e.skip, e.rad, e.comp, e.var,
+          "\n".join(e.on), "\n".join(e.kun), "\n".join(e.nanori),
+          "\n".join(e.meaning)))
+  for k in e.comp:
+    yield ("INSERT INTO comp VALUES (?,?)", (ord(e.char), ord(k)))
                                                                 # }}}1
 
                                                                 # {{{1
@@ -335,14 +409,14 @@ KANJIDIC_CREATE_SQL = """
     code INTEGER,
     FOREIGN KEY(entry) REFERENCES entry(code)
   );
+"""
 
+KANJIDIC_INDEX_SQL = """
   CREATE INDEX idx_comp ON comp (code);
 """                                                             # }}}1
 
 def setup(file = SQLITE_FILE):
-  kanjivg   = parse_kanjivg()
-  kanjidic  = parse_kanjidic(kanjivg)
-  kanjidic2sqldb(kanjidic, file)
+  kanjidic2sqldb(iter_kanjidic(parse_kanjivg()), file)
 
 def row2entry(r):
   i = r.keys().index("on_")
@@ -375,54 +449,76 @@ def search(q, max_results = None, level = None, jlpt = None,
     if (r := random(level, jlpt, strokes, file = file)) is not None:
       yield r
     return
+  if (s := store(file)) and \
+     (r := s.search(q, max_results, level, jlpt, strokes)) is not None:
+    yield from r
+    return
+  key = (q, max_results, level, jlpt, strokes)
+  with sqlite_do(file) as c:
+    if (codes := CACHE.get(file, key)) is not None:
+      yield from load_codes(c, codes)
+      return
+    codes = []
+    for e in _search(c, q, max_results, level, jlpt, strokes, file):
+      codes.append(ord(e.char))
+      yield e
+    CACHE.put(file, key, codes)
+                                                                # }}}1
+
+def _search(c, q, max_results, level, jlpt, strokes, file):     # {{{1
   ideo  = tuple(M.uniq(filter(M.isideo, q)))
-  order = """ORDER BY IFNULL(freq, {}) ASC, level2int(level) ASC,
-             code ASC""".format(NOFREQ)                       # safe!
   limit = "LIMIT " + str(int(max_results)) if max_results else ""
-  with sqlite_do(file) as c:
-    c.connection.create_function("level2int", 1, level2int)
-    ms = re.fullmatch(r"\+s(?:kip)?\s*([\d-]+)", q, re.I)
-    mr = re.fullmatch(r"\+r(?:ad(?:icals?)?)?\s*(\S+)", q, re.I)
-    fltr_w, fltr_a = search_filter(level, jlpt, strokes)
-    if ms:
-      for r in c.execute(f"""
-          SELECT * FROM entry WHERE skip = ? {fltr_a} {order} {limit}
-          """, (ms.group(1),)):                               # safe!
-        yield row2entry(r)
-    elif mr:
-      rads = [ VAR2RAD.get(c, c) for c in mr.group(1)
-               if M.isideo(c) or M.iskana(c) or M.isradical(c) ]
-      if not rads: return                                       # TODO
-      radp = [ str(ord(c)) for c in rads ]
-      subq = "SELECT entry FROM comp WHERE code = ?"
-      isct = " INTERSECT ".join( subq for _ in radp )
-      for r in c.execute(f"""
-          SELECT entry.* FROM ({isct})
-          INNER JOIN entry ON code = entry
-          {fltr_w} {order} {limit}
-          """, radp):                                         # safe!
-        yield row2entry(r)
-    elif ideo:
-      for char in ideo:
-        for r in c.execute("SELECT * FROM entry WHERE code = ?", (ord(char),)):
-          yield row2entry(r) # #=1
-    else:
-      load_pcre_extension(c.connection)
-      for r in c.execute(f"""
-          SELECT * FROM entry WHERE (
-                            on_                        REGEXP :re OR
-                            kun                        REGEXP :re OR
-                            nanori                     REGEXP :re OR
-            replace(replace(on_   , '.', ''), '-', '') REGEXP :re OR
-            replace(replace(kun   , '.', ''), '-', '') REGEXP :re OR
-            replace(replace(nanori, '.', ''), '-', '') REGEXP :re OR
-                            meaning                    REGEXP :re )
-            {fltr_a} {order} {limit}
-          """, dict(re = M.q2rx(q))):                         # safe!
-        yield row2entry(r)
+  ms = re.fullmatch(r"\+s(?:kip)?\s*([\d-]+)", q, re.I)
+  mr = re.fullmatch(r"\+r(?:ad(?:icals?)?)?\s*(\S+)", q, re.I)
+  fltr_w, fltr_a = search_filter(level, jlpt, strokes)
+  if ms:
+    for r in c.execute(f"""
+        SELECT * FROM entry WHERE skip = ? {fltr_a} {ORDER} {limit}
+        """, (ms.group(1),)):                                 # safe!
+      yield row2entry(r)
+  elif mr:
+    if not (rads := radicals(mr.group(1))): return              # TODO
+    cs    = comps(file)
+    codes = [ ord(k) for k in cs.kanji(cs.mask(rads)) ]
+    n     = int(max_results) if max_results else None
+    yield from itertools.islice(load_codes(c, codes, fltr_a), n)
+  elif ideo:
+    for char in ideo:
+      for r in c.execute("SELECT * FROM entry WHERE code = ?",
+                         (ord(char),)):
+        yield row2entry(r) # #=1
+  else:
+    load_pcre_extension(c.connection)
+    for r in c.execute(f"""
+        SELECT * FROM entry WHERE (
+                          on_                        REGEXP :re OR
+                          kun                        REGEXP :re OR
+                          nanori                     REGEXP :re OR
+          replace(replace(on_   , '.', ''), '-', '') REGEXP :re OR
+          replace(replace(kun   , '.', ''), '-', '') REGEXP :re OR
+          replace(replace(nanori, '.', ''), '-', '') REGEXP :re OR
+                          meaning                    REGEXP :re )
+          {fltr_a} {ORDER} {limit}
+        """, dict(re = M.q2rx(q))):                           # safe!
+      yield row2entry(r)
                                                                 # }}}1
 
+# NB: entries (in the order given) by code; fltr from search_filter
+def load_codes(c, codes, fltr = ""):
+  for i in range(0, len(codes), J.MAXVARS):
+    chunk = codes[i:i+J.MAXVARS]
+    ps    = ",".join("?" * len(chunk))
+    rows  = { r["code"]: r for r in c.execute(f"""
+              SELECT * FROM entry WHERE code IN ({ps}) {fltr}
+              """, chunk) }                                   # safe!
+    for code in chunk:
+      if (r := rows.get(code)) is not None: yield row2entry(r)
+
 def by_freq(file = SQLITE_FILE):
+  if s := store(file):
+    yield from ( (e.char, e.freq) + s.readmeans[e.char]
+                 for e in s.entries if e.freq is not None )
+    return
   with sqlite_do(file) as c:
     for r in c.execute("""
         SELECT char, freq, on_, kun, meaning FROM entry
@@ -431,6 +527,11 @@ def by_freq(file = SQLITE_FILE):
       yield (r["char"], r["freq"]) + _readmean(r)
 
 def by_level(level, *, file = SQLITE_FILE):
+  if s := store(file):
+    yield from ( (e.char,) + s.readmeans[e.char]
+                 for e in sorted(s.by_level.get(level, ()),
+                                 key = lambda e: e.char) )
+    return
   with sqlite_do(file) as c:
     for r in c.execute("""
         SELECT char, on_, kun, meaning FROM entry
@@ -440,14 +541,28 @@ def by_level(level, *, file = SQLITE_FILE):
 
 def by_jlpt(file = SQLITE_FILE):
   data = { int(l): [] for l in "12345" }
-  with sqlite_do(file) as c:
-    for char, level in JLPT.items():
-      data[level].append((char,) + readmean(char, c))
+  if s := store(file):
+    for l in data:
+      data[l] = [ (e.char,) + s.readmeans[e.char]
+                  for e in s.by_jlpt.get(l, ()) ]
+  else:
+    with sqlite_do(file) as c:
+      for r in c.execute("""
+          SELECT char, new_jlpt, on_, kun, meaning FROM entry
+            WHERE new_jlpt IS NOT NULL
+          """):
+        data[r["new_jlpt"]].append((r["char"],) + _readmean(r))
   for level in "54321":
     yield int(level), tuple(sorted(data[int(level)]))
 
 def by_skip(category, *, file = SQLITE_FILE):
   data = []
+  if s := store(file):
+    for skip, es in s.by_skip.items():
+      if skip is None or skip[:1] != str(category): continue
+      t = tuple( int(n) for n in skip.split("-") )
+      data += [ (t, skip, e.char) + s.readmeans[e.char] for e in es ]
+    return sorted(data, key = lambda x: x[:3])
   with sqlite_do(file) as c:
     for r in c.execute("""
         SELECT char, on_, kun, meaning, skip FROM entry
@@ -457,27 +572,194 @@ def by_skip(category, *, file = SQLITE_FILE):
       data.append((skip, r["skip"], r["char"]) + _readmean(r))
   return sorted(data, key = lambda x: x[0])
 
+# NB: iterating over results (entries w/ chars(), or tuples starting w/
+# one) w/ lookup.batched(results) loads the readings & meanings of all
+# their (uncached) kanji RMSN results at a time; lookups are
+# served from the (process-wide) LRU cache RMS (w/ the DB file only
+# checked for changes once per context)
 @contextmanager
 def readmeans(file = SQLITE_FILE):
+  if s := store(file):
+    def lookup(char): return s.readmeans.get(char)
+    lookup.batched = lambda results: results
+    yield lookup
+    return
   with sqlite_do(file) as c:
-    yield lambda char: readmean(char, c)
-
-def readmean(char, c):
-  r = c.execute("SELECT on_, kun, meaning FROM entry WHERE code = ?",
-                (ord(char),)).fetchone()
-  return _readmean(r) if r else None
+    fi = cache_ident(file)
+    def lookup(char):
+      if (rm := RMS.get(file, char, fi)) is None:
+        rm = load_readmeans(c, [char], file, fi)[char]
+      return rm or None
+    def batched(results):
+      it = iter(results)
+      while chunk := list(itertools.islice(it, RMSN)):
+        es = [ x if hasattr(x, "chars") else x[0] for x in chunk ]
+        cs = set( ch for e in es for ch in e.chars() )
+        load_readmeans(c, [ ch for ch in cs
+                            if RMS.get(file, ch, fi) is None ],
+                       file, fi)
+        yield from chunk
+    lookup.batched = batched
+    yield lookup
+
+# NB: caches () for missing kanji
+def load_readmeans(c, chars, file = SQLITE_FILE, ident = None):
+  data = { ch: () for ch in chars }
+  for i in range(0, len(chars), J.MAXVARS):
+    chunk = [ ord(ch) for ch in chars[i:i+J.MAXVARS] ]
+    ps    = ",".join("?" * len(chunk))
+    for r in c.execute(f"""SELECT char, on_, kun, meaning FROM entry
+                            WHERE code IN ({ps})""", chunk): # safe!
+      data[r["char"]] = _readmean(r)
+  for ch, rm in data.items(): RMS.put(file, ch, rm, ident)
+  return data
 
 def _readmean(r):
   return (tuple(r["on_"].splitlines() + r["kun"].splitlines()),
           tuple(r["meaning"].splitlines()))
 
 def random(level = None, jlpt = None, strokes = None, *, file = SQLITE_FILE):
+  if s := store(file): return s.random(level, jlpt, strokes)
   with sqlite_do(file) as c:
-    c.connection.create_function("level2int", 1, level2int)
     fltr_w, fltr_a = search_filter(level, jlpt, strokes)
-    q = f"SELECT * FROM entry {fltr_w} ORDER BY RANDOM() LIMIT 1"
-    r = c.execute(q).fetchone()
-    return None if r is None else row2entry(r)
+    if not (r := random_keys(c, "entry", "code", fltr_a)): return None
+    return next(load_codes(c, r))
+
+# NB: resident (per process) copy of the whole (small) kanji DB w/
+# indexes by char, skip code, level, jlpt & component (see Comps);
+# when MEMORY is set, search (except for regexes), readmeans, random &
+# the by_* listings are answered from it; reloaded when the DB file
+# changes
+class Store:                                                    # {{{1
+  __slots__ = """entries by_char by_skip by_level by_jlpt comps
+                 readmeans""".split()
+
+  def __init__(self, c):
+    es = sorted(map(row2entry, c.execute("SELECT * FROM entry")),
+                key = Store.order)
+    self.entries, self.readmeans = es, {}
+    self.by_char  = { e.char: e for e in es }
+    self.by_skip, self.by_level, self.by_jlpt = {}, {}, {}
+    for e in es:
+      self.readmeans[e.char] = (e.on + e.kun, e.meaning)
+      self.by_skip .setdefault(e.skip    , []).append(e)
+      self.by_level.setdefault(e.level   , []).append(e)
+      self.by_jlpt .setdefault(e.new_jlpt, []).append(e)
+    self.comps = Comps(c)
+
+  # NB: same order as _search
+  @staticmethod
+  def order(e):
+    return (NOFREQ if e.freq is None else e.freq, level2int(e.level),
+            ord(e.char))
+
+  @staticmethod
+  def matches(e, level, jlpt, strokes):
+    ok = lambda x, r: x is not None and int(r[0]) <= x <= int(r[1])
+    return (not level   or ok(level2int(e.level), level)) and \
+           (not jlpt    or ok(e.new_jlpt, jlpt))         and \
+           (not strokes or ok(e.strokes, strokes))
+
+  # NB: like _search; returns None for regex queries
+  def search(self, q, max_results, level, jlpt, strokes):
+    ideo  = tuple(M.uniq(filter(M.isideo, q)))
+    ms    = re.fullmatch(r"\+s(?:kip)?\s*([\d-]+)", q, re.I)
+    mr    = re.fullmatch(r"\+r(?:ad(?:icals?)?)?\s*(\S+)", q, re.I)
+    if ms:
+      es = self.by_skip.get(ms.group(1), ())
+    elif mr:
+      if not (rads := radicals(mr.group(1))): return ()         # TODO
+      cs = self.comps
+      es = [ self.by_char[k] for k in cs.kanji(cs.mask(rads)) ]
+    elif ideo:
+      return [ self.by_char[c] for c in ideo if c in self.by_char ]
+    else:
+      return None
+    es = ( e for e in es if self.matches(e, level, jlpt, strokes) )
+    n  = int(max_results) if max_results else None
+    return itertools.islice(es, n)
+
+  # NB: rejection sampling (like random_keys), then a scan
+  def random(self, level, jlpt, strokes, tries = SAMPLE_TRIES):
+    for _ in range(tries):
+      if self.matches(e := choice(self.entries), level, jlpt, strokes):
+        return e
+    es = [ e for e in self.entries
+           if self.matches(e, level, jlpt, strokes) ]
+    return choice(es) if es else None
+                                                                # }}}1
+
+# NB: per-component bitsets (python ints) over all kanji in search
+# order: bit i of bits[comp] is set iff chars[i] contains comp; a
+# radical search is the AND of the masks of its radicals
+class Comps:                                                    # {{{1
+  __slots__ = "chars bits".split()
+
+  def __init__(self, c):
+    self.chars  = [ chr(r["code"]) for r in c.execute(
+                    f"SELECT code FROM entry {ORDER}") ]       # safe!
+    index, bits = { ch: i for i, ch in enumerate(self.chars) }, {}
+    for entry, code in c.execute("SELECT entry, code FROM comp"):
+      k = chr(code)
+      bits[k] = bits.get(k, 0) | 1 << index[chr(entry)]
+    self.bits = bits
+
+  def mask(self, rads):
+    m = (1 << len(self.chars)) - 1
+    for r in rads: m &= self.bits.get(r, 0)
+    return m
+
+  def kanji(self, mask, limit = None):
+    ks = []
+    while mask and len(ks) != limit:
+      low = mask & -mask
+      ks.append(self.chars[low.bit_length() - 1])
+      mask ^= low
+    return ks
+
+  def count(self, mask):
+    return bin(mask).count("1")
+
+  # NB: whether adding comp would leave > 0 results
+  def valid(self, mask, comp):
+    return bool(self.bits.get(comp, 0) & mask)
+                                                                # }}}1
+
+RESIDENT, RESIDENT_LOCK = {}, threading.Lock()
+
+# NB: cls(c) loaded once per process & DB file (version)
+def resident(cls, file):
+  try:
+    st = os.stat(file)
+  except OSError:
+    return None
+  ident = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+  with RESIDENT_LOCK:
+    if (x := RESIDENT.get((cls, file))) is None or x[0] != ident:
+      with sqlite_do(file) as c:
+        RESIDENT[(cls, file)] = x = (ident, cls(c))
+  return x[1]
+
+def store(file = SQLITE_FILE):
+  return resident(Store, file) if MEMORY else None
+
+def comps(file = SQLITE_FILE):
+  if s := store(file): return s.comps
+  return resident(Comps, file)
+
+def radicals(q):
+  return [ VAR2RAD.get(c, c) for c in q
+           if M.isideo(c) or M.iskana(c) or M.isradical(c) ]
+
+# NB: for the radical picker: (kanji containing all of q's radicals (at
+# most limit), # of such kanji, the picker radicals still valid)
+def radical_candidates(q, limit = None, *, file = SQLITE_FILE):
+  cs    = comps(file)
+  mask  = cs.mask(rads := radicals(q))
+  picks = "".join( r for g in RADTABLE for r, _ in g
+                   if cs.valid(mask, VAR2RAD.get(r, r)) )
+  if not rads: return "", 0, picks
+  return "".join(cs.kanji(mask, limit)), cs.count(mask), picks
 
 RADICALS      = tuple( chr(i) + UD.normalize("NFKC", chr(i))    # {{{1
                        for i in range(0x2f00, 0x2fd6) )
@@ -553,8 +835,8 @@ RADVARSPRIV = tuple("""穴 麻 舟 歹 言 巾 白 八 
 馬 魚 牛 矢 山 山 弓 韋 牙 舛 肉 目""".split())   # TODO
                                                                 # }}}1
 
-MIN_STROKES, MAX_STROKES = 1, 34
-STROKES_T = M.IntOrRange(MIN_STROKES, MAX_STROKES, "STROKES")
+MIN_STROKES, MAX_STROKES = M.MIN_STROKES, M.MAX_STROKES
+STROKES_T = M.STROKES_T
 
 if __name__ == "__main__":
   if "--doctest" in sys.argv:
@@ -38,6 +38,11 @@ True
 >>> list(uniq([1, 2, 3, 1, 4, 2, 2]))
 [1, 2, 3, 4]
 
+>>> import io
+>>> xml = b"<r><a>1</a><b>2</b><a>3<a>4</a></a></r>"
+>>> [ e.text for e in iterparse(io.BytesIO(xml), "a") ]
+['1', '3']
+
 >>> q2like(r"+w foo")
 '%foo%'
 >>> q2like(r".foo.*bar[a-z]baz")
@@ -53,9 +58,23 @@ True
 >>> q2like(r"\\") is None
 True
 
+>>> isliteral("cat food"), isliteral("+w cat"), isliteral("c.t")
+(True, False, False)
+>>> isliteral("50%"), isliteral("猫")
+(False, False)
+
+>>> bigrams("日本語")
+['日本', '本語']
+>>> like_bigrams("%日本語%"), like_bigrams("%猫_犬%")
+(['日本', '本語'], [])
+>>> like_bigrams("%cat%")
+[]
+>>> like_bigrams(q2like(r"^猫の\pK+ねこ"))
+['ねこ', '猫の']
+
 """                                                             # }}}1
 
-import hashlib, itertools, re, os, sys, urllib.request
+import hashlib, importlib.util, itertools, re, os, sys, urllib.request
 
 import click
 
@@ -102,6 +121,32 @@ def uniq(xs):
     if x not in seen:
       seen.add(x); yield x
 
+# NB: streaming; yields the children of the root w/ the given tag,
+# which are discarded afterwards; xml.etree is imported here as only
+# setup needs it
+def iterparse(f, tag):
+  import xml.etree.ElementTree as ET
+  it, depth = ET.iterparse(f, events = ("start", "end")), 0
+  for event, e in it:
+    if event == "start":
+      if depth == 0: root = e
+      depth += 1
+    else:
+      depth -= 1
+      if depth == 1:
+        if e.tag == tag: yield e
+        root.clear()
+
+# NB: the module is only executed on first attribute access
+def lazy_import(name):
+  if name in sys.modules: return sys.modules[name]
+  spec        = importlib.util.find_spec(name)
+  spec.loader = importlib.util.LazyLoader(spec.loader)
+  mod         = importlib.util.module_from_spec(spec)
+  sys.modules[name] = mod
+  spec.loader.exec_module(mod)
+  return mod
+
 # TODO: use importlib.resources?!
 def resource_path(path):
   return os.path.join(os.path.dirname(__file__), *path.split("/"))
@@ -150,6 +195,20 @@ def q2like(q):                                                  # {{{1
   return re.sub(r"%%+", "%", "%" + p + "%")
                                                                 # }}}1
 
+# NB: LIKE is only case-insensitive for ASCII
+def isliteral(q):
+  return isascii(q) and not any( c in LITERALX for c in q )
+
+LITERALX = r"\.^$*+?{}[]|()%_"
+
+def bigrams(s): return [ s[i:i+2] for i in range(len(s) - 1) ]
+
+# NB: bigrams of the CJK runs of a LIKE pattern; every match contains
+# all of them (LIKE is exact for non-ASCII)
+def like_bigrams(p):
+  runs = [ r for r in re.split(r"[%_]", p) if iscjk(r) ]
+  return sorted(set(flatten(map(bigrams, runs))))
+
 def q2rx(q):
   if   q.startswith("+="): q = "^"   + q[2:].lstrip() +   "$"
   elif q.startswith("+1"): q = "^"   + q[2:].lstrip() + "\\b"
@@ -180,6 +239,14 @@ class IntOrRange(click.ParamType):                              # {{{1
 
 JLPT_LEVEL = IntOrRange(1, 5, "LEVEL")
 
+# NB: here (instead of jmdict/kanji/sentences) so the CLI can define
+# its options w/o importing those
+LANGSFULL   = "english dutch german french spanish swedish".split()
+LANGS       = [ l[:3] for l in LANGSFULL ]
+
+MIN_STROKES, MAX_STROKES = 1, 34
+STROKES_T = IntOrRange(MIN_STROKES, MAX_STROKES, "STROKES")
+
 def download_file(url, file, sha512 = None, tmp = ".tmp"):      # {{{1
   if sha512 and os.path.exists(file):
     sha = hashlib.sha512()
@@ -29,6 +29,8 @@ Pitch Accent from Wadoku.
 
 >>> [ x for x in pitch if x[0] == "小猫" ][0]
 ['小猫', 'こねこ', '2']
+>>> get_pitch("こねこ", ["子猫", "小猫"]), get_pitch("こねこ", ["猫"])
+('こꜛねꜜこ', None)
 >>> with_accent("こねこ", 2)
 'こꜛねꜜこ'
 
@@ -62,17 +64,18 @@ Pitch Accent from Wadoku.
 
 import functools, os, re, sys
 
-from contextlib import contextmanager
-
 import click
 
 from . import misc as M
-from .sql import sqlite_do
+from .kana import katakana2hiragana
+from .sql import sqlite_do, sqlite_bulk
 
 SQLITE_FILE = M.resource_path("res/pitch.sqlite3")
 PITCH_FILE  = M.resource_path("res/pitch/PITCH")
 DATA_FILES  = (SQLITE_FILE,)
 
+MAXVARS     = 500
+
 # NB: skip ･ for e.g. せꜛい･いꜜっぱい
 MORASPLIT   = re.compile(r"(･?.[ぁぃぅぇぉゃょゅァィゥェォャュョ]?)")
 
@@ -103,11 +106,11 @@ def parse_pitch(file = PITCH_FILE):
   return data
 
 def pitch2sqldb(data, file = SQLITE_FILE):
-  with sqlite_do(file, write = True) as c:
+  with sqlite_bulk(file) as c:
     c.executescript(PITCH_CREATE_SQL)
     with click.progressbar(data, width = 0, label = "writing pitch") as bar:
-      for e in bar:
-        c.execute("INSERT INTO entry VALUES (?,?,?)", e)
+      c.executemany("INSERT INTO entry VALUES (?,?,?)", bar)
+    c.executescript(PITCH_INDEX_SQL)
 
                                                                 # {{{1
 PITCH_CREATE_SQL = """
@@ -117,6 +120,9 @@ PITCH_CREATE_SQL = """
     reading TEXT,
     accent TEXT
   );
+"""
+
+PITCH_INDEX_SQL = """
   CREATE INDEX idx_kanji ON entry (kanji);
 """                                                             # }}}1
 
@@ -125,29 +131,55 @@ def setup(file = SQLITE_FILE):
     pitch = parse_pitch()
     pitch2sqldb(pitch, file)
 
-@contextmanager
-def pitches(file = SQLITE_FILE):
-  if have_pitch(file):
+# NB: the pitches (as Entry.pitch) of many entries at once, w/ one
+# query per MAXVARS kanji; returns { seq: pitches }; used to fill the
+# pitch table of the jmdict DB (see jmdict.pitches)
+def get_pitches(entries, conn = None, *, file = SQLITE_FILE):
+  entries = list(entries)
+  if not have_pitch(file): return { e.seq: () for e in entries }
+  if conn is None:
     with sqlite_do(file) as c:
-      yield lambda e: e.pitch(conn = c)
-  else:
-    yield lambda e: ()
+      return get_pitches(entries, c, file = file)
+  kanjis  = { e.seq: [ k.replace("・", "") for k in e.definition() ]
+              for e in entries }
+  rows    = _pitch_rows(conn, sorted(set(
+              k for ks in kanjis.values() for k in ks )))
+  return { e.seq: tuple(M.uniq(_pitches(e, kanjis[e.seq], rows)))
+           for e in entries }
+
+def _pitch_rows(c, kanjis):
+  rows = {}
+  for i in range(0, len(kanjis), MAXVARS):
+    chunk = kanjis[i:i+MAXVARS]
+    ps    = ",".join("?" * len(chunk))
+    for r in c.execute(f"SELECT * FROM entry WHERE kanji IN ({ps}) " +
+                       "ORDER BY rowid", chunk):             # safe!
+      rows.setdefault(r["kanji"], []).append(r)
+  return rows
+
+def _pitches(e, kanjis, rows):
+  rs = tuple( r.elem for r in e.reading )
+  hr = tuple( katakana2hiragana(r) for r in rs )
+  for r in rs + tuple( r for r in hr if r not in rs ):
+    if (p := _pitch(r, kanjis, rows)) is not None: yield p
+
+def _pitch(reading, kanjis, rows):
+  rd = reading.replace("・", "")
+  for k in kanjis:
+    ps = [ x for x in rows.get(k, ())
+           if x["reading"].replace("—", "") == rd ]
+    if ps: return with_pitch(ps[0])
+  return None
 
-# TODO
+# NB: the pitch of a single reading (see get_pitches)
 def get_pitch(reading, kanjis, conn = None, *, file = SQLITE_FILE):
-  rd = reading.replace("・", "")
-  def f(c):
-    for k in ( k.replace("・", "") for k in kanjis ):
-      for r in c.execute("SELECT * FROM entry WHERE kanji = ?", (k,)):
-        if r["reading"].replace("—", "") != rd: continue
-        return with_pitch(r)
-    return None
-  if have_pitch(file):
-    if conn is not None:
-      return f(conn)
+  if not have_pitch(file): return None
+  if conn is None:
     with sqlite_do(file) as c:
-      return f(c)
-  return None
+      return get_pitch(reading, kanjis, c, file = file)
+  kanjis = [ k.replace("・", "") for k in kanjis ]
+  rows   = _pitch_rows(conn, sorted(set(kanjis)))
+  return _pitch(reading, kanjis, rows)
 
 def with_pitch(r):
   sr, sa  = r["reading"].split("—"), r["accent"].split("—")
@@ -70,17 +70,24 @@ from collections import namedtuple
 import click
 
 from . import misc as M
-from .sql import sqlite_do
+from .sql import sqlite_do, sqlite_bulk, ResultCache, sample2sqldb, \
+                 random_keys
 
 SQLITE_FILE     = M.resource_path("res/sentences.sqlite3")
 SENTENCES_FILE  = M.resource_path("res/sentences/SENTENCES")
 AUDIO_DIR       = M.resource_path("static/audio")
 DATA_FILES      = (SQLITE_FILE, SENTENCES_FILE)
+MAXVARS         = 500     # NB: SQLITE_MAX_VARIABLE_NUMBER >= 999
+CACHE           = ResultCache("sentences")
 
-LANGSFULL = "english dutch german french spanish swedish".split()
-LANGS     = [ l[:3] for l in LANGSFULL ]
+LANGSFULL = M.LANGSFULL
+LANGS     = M.LANGS
 Entry     = namedtuple("Entry", "id jap".split() + LANGS + ["audio"])
 
+def chars(e): return frozenset( c for c in e.jap if M.isideo(c) )
+
+Entry.chars = chars
+
 def parse_sentences(file = SENTENCES_FILE):
   data = []
   with open(file) as f:
@@ -92,11 +99,11 @@ def parse_sentences(file = SENTENCES_FILE):
   return data
 
 def sentences2sqldb(data, file = SQLITE_FILE):
-  with sqlite_do(file, write = True) as c:
+  with sqlite_bulk(file) as c:
     c.executescript(SENTENCES_CREATE_SQL)
     with click.progressbar(data, width = 0, label = "writing sentences") as bar:
-      for e in bar:
-        c.execute("INSERT INTO entry VALUES (?,?,?,?,?,?,?,?,?)", e)
+      c.executemany("INSERT INTO entry VALUES (?,?,?,?,?,?,?,?,?)", bar)
+    sample2sqldb(c, "entry", "id")
 
                                                                 # {{{1
 SENTENCES_CREATE_SQL = """
@@ -127,21 +134,36 @@ def search(q, langs = [], max_results = None, audio = False, *,
   lim   = "LIMIT " + str(int(max_results)) if max_results else ""
   with sqlite_do(file) as c:
     if q.lower() == "+random":
-      for r in c.execute("""
-          SELECT * FROM entry WHERE 1=1 {} {} ORDER BY RANDOM() {}
-          """.format(lang, aud, lim)):                        # safe!
-        yield Entry(*r)
+      ids = random_keys(c, "entry", "id", lang + " " + aud,
+                        limit = max_results)
+      yield from load_ids(c, ids)
     elif re.fullmatch(r"\+#\s*\d+", q):
       id = int(q[2:].strip())
       for r in c.execute("SELECT * FROM entry WHERE id = ?", (id,)):
         yield Entry(*r) # #=1
     else:
+      key = (q, tuple(langs), max_results, audio)
+      if (ids := CACHE.get(file, key)) is not None:
+        yield from load_ids(c, ids)
+        return
       sel = ["jap"] + ([] if M.iscjk(q) else LANGS)
       s   = " OR ".join( x + " LIKE :q" for x in sel )
+      ids = []
       for r in c.execute("""
           SELECT * FROM entry WHERE ({}) {} {} ORDER BY id {}
           """.format(s, lang, aud, lim), dict(q="%"+q+"%")):  # safe!
+        ids.append(r["id"])
         yield Entry(*r)
+      CACHE.put(file, key, ids)
+
+# NB: entries (in the order given) by id
+def load_ids(c, ids):
+  for i in range(0, len(ids), MAXVARS):
+    chunk = ids[i:i+MAXVARS]
+    ps    = ",".join("?" * len(chunk))
+    q     = f"SELECT * FROM entry WHERE id IN ({ps})"         # safe!
+    rows  = { r["id"]: r for r in c.execute(q, chunk) }
+    for id in chunk: yield Entry(*rows[id])
 
 @functools.lru_cache(maxsize = None)
 def have_audio(id):
@@ -18,33 +18,353 @@ r"""
 
 SQL helper functions.
 
+>>> import tempfile
+>>> tmp   = tempfile.TemporaryDirectory()
+>>> db    = os.path.join(tmp.name, "db")
+>>> with open(db, "w") as f: _ = f.write("v1")
+>>> cache = ResultCache("test", 1, size = 2,
+...                     shared = os.path.join(tmp.name, "cache"))
+>>> cache.get(db, "a") is None
+True
+>>> cache.put(db, "a", [1, 2])
+>>> cache.get(db, "a")
+[1, 2]
+>>> cache.put(db, "b", [3])
+>>> cache.put(db, "c", [4])
+>>> list(cache.data) == [ cache._key(db, k) for k in "bc" ]
+True
+>>> cache.get(db, "a")                  # evicted, but still shared
+[1, 2]
+>>> cache.put(db, "d", list(range(CACHE_ITEM_MAX + 1)))
+>>> cache.get(db, "d") is None          # too large to cache
+True
+>>> with open(db, "w") as f: _ = f.write("v2 (changed)")
+>>> cache.get(db, "a") is None          # invalidated
+True
+>>> cache.stats()
+{'hits': 1, 'misses': 3, 'shared_hits': 1, 'size': 2, 'skipped': 1}
+>>> del CACHES["test"]
+>>> tmp.cleanup()
+
+>>> c = sqlite3.connect(":memory:").cursor()
+>>> _ = c.execute("CREATE TABLE t(k INTEGER PRIMARY KEY, v INTEGER)")
+>>> _ = c.executemany("INSERT INTO t VALUES (?,?)",
+...                   ( (k, k % 10) for k in range(1, 1001) ))
+>>> sample2sqldb(c, "t", "k")
+>>> ks = random_keys(c, "t", "k", "AND v = :v", dict(v = 3), limit = 5)
+>>> len(set(ks)), all( k % 10 == 3 for k in ks )
+(5, True)
+>>> random_keys(c, "t", "k", "AND k = 7", tries = 1)    # fallback
+[7]
+>>> sorted(random_keys(c, "t", "k", "AND k IN (1, 2)", limit = 5))
+[1, 2]
+>>> random_keys(c, "t", "k", "AND k < 0")
+[]
+>>> len(random_keys(c, "t", "k", limit = None))
+1000
+>>> qs = []
+>>> c.connection.set_trace_callback(qs.append)
+>>> ks = random_keys(c, "t", "k", "AND k % 100 = 1", limit = 50)
+>>> c.connection.set_trace_callback(None)
+>>> sorted(ks) == list(range(1, 1001, 100)), len(qs) < 20
+(True, True)
+
 """                                                             # }}}1
 
-import importlib.util, sqlite3
+import importlib.util, json, os, random, sqlite3, sys, threading
 
+from collections import OrderedDict
 from contextlib import contextmanager
 from pathlib import Path
 
 from . import misc as M
 
+STATEMENTS  = 256
+PRAGMAS     = """
+  PRAGMA query_only = 1;
+  PRAGMA mmap_size  = 268435456;
+  PRAGMA cache_size = -16384;
+"""
+
+BULK_SIZE   = 10000
+BULK_PRAGMAS = """
+  PRAGMA journal_mode = OFF;
+  PRAGMA synchronous  = OFF;
+  PRAGMA cache_size   = -65536;
+"""
+
+CACHE_SIZE  = 1024
+CACHE_FILE  = os.environ.get("JITEN_CACHE") or None     # NB: shared
+CACHE_MAX   = 65536
+CACHE_ITEM_MAX = 10000    # NB: larger results are not cached
+CACHE_SQL   = """
+  PRAGMA journal_mode = WAL;
+  PRAGMA synchronous  = NORMAL;
+  CREATE TABLE IF NOT EXISTS cache(
+    key TEXT PRIMARY KEY,
+    value TEXT,
+    used INTEGER
+  );
+  CREATE INDEX IF NOT EXISTS idx_cache_used ON cache (used);
+"""
+
+SAMPLE_TRIES = 64   # NB: per random_keys call (plus one per key)
+SAMPLE_PROBE = 8    # NB: lookups before giving up on a low hit rate
+
+FUNCTIONS   = {}
+POOL        = threading.local()
+CACHES      = {}
+
+class Connection(sqlite3.Connection):
+  pcre = False
+
+def register_function(name, narg, f):
+  FUNCTIONS[name] = (narg, f)
+
 @contextmanager
 def sqlite_do(file, write = False):
-  if write:
-    conn = sqlite3.connect(file)
-  else:
-    uri  = Path(file).as_uri() + "?mode=ro"
-    conn = sqlite3.connect(uri, uri = True)
-  conn.row_factory = sqlite3.Row
+  conn = connect(file, write) if write else pooled_connection(file)
+  c    = conn.cursor()
   try:
-    yield conn.cursor()
+    yield c
     conn.commit()
   except sqlite3.OperationalError as e:
     if not str(e).startswith("[REGEXP] "): raise e
     raise M.RegexError(str(e)[9:])
   finally:
-    conn.close()
+    c.close()
+    if write: conn.close()
+
+# NB: for building DBs (w/o journal, so not crash-safe); create
+# indexes after inserting the data; the DB is built in a temporary
+# file that only replaces file once complete, so a failed build
+# leaves the existing DB (if any) untouched
+@contextmanager
+def sqlite_bulk(file):
+  tmp = file + ".tmp"
+  if os.path.exists(tmp): os.remove(tmp)
+  try:
+    with sqlite_do(tmp, write = True) as c:
+      c.executescript(BULK_PRAGMAS)
+      yield c
+      c.executescript("ANALYZE; VACUUM;")
+  except BaseException:
+    if os.path.exists(tmp): os.remove(tmp)
+    raise
+  os.replace(tmp, file)
+
+# NB: rows are (sql, params) pairs; preserves the order per statement
+def insert_rows(c, rows, size = BULK_SIZE):
+  batch, n = {}, 0
+  for q, row in rows:
+    batch.setdefault(q, []).append(row)
+    n += 1
+    if n == size:
+      _insert_batch(c, batch)
+      n = 0
+  _insert_batch(c, batch)
+
+def _insert_batch(c, batch):
+  for q, rows in batch.items(): c.executemany(q, rows)
+  batch.clear()
+
+def connect(file, write = False):
+  if write:
+    conn = sqlite3.connect(file, factory = Connection)
+  else:
+    uri  = Path(file).as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri = True, factory = Connection,
+                           cached_statements = STATEMENTS)
+    conn.executescript(PRAGMAS)
+  conn.row_factory = sqlite3.Row
+  for name, (narg, f) in FUNCTIONS.items():
+    conn.create_function(name, narg, f, deterministic = True)
+  return conn
+
+# NB: one read-only connection per thread (and process) per file;
+# reconnects when the file is replaced (e.g. by download_dbs)
+def pooled_connection(file):
+  conns = POOL.__dict__.setdefault("conns", {})
+  ident = _file_ident(file)
+  if file in conns:
+    i, conn = conns.pop(file)
+    if i == ident:
+      conns[file] = (i, conn)
+      return conn
+    if i[0] == ident[0]: conn.close()       # NB: not after fork
+  conn = connect(file)
+  conns[file] = (ident, conn)
+  return conn
+
+def _file_ident(file):
+  try:
+    st = os.stat(file)
+  except OSError:
+    return (os.getpid(), None)
+  return (os.getpid(), st.st_dev, st.st_ino)
+
+# NB: caches (JSON-serialisable) materialized results (e.g. seqs) per
+# DB file & key; invalidated when the file (or version) changes; LRU
+# in-process, optionally also shared (between processes) via the
+# JITEN_CACHE sqlite file
+class ResultCache:                                              # {{{1
+  def __init__(self, name, version = None, size = CACHE_SIZE,
+               shared = CACHE_FILE):
+    self.name, self.version, self.size = name, version, size
+    self.shared, self.data, self.lock = shared, OrderedDict(), \
+                                        threading.Lock()
+    self.local  = threading.local()
+    self.hits = self.misses = self.shared_hits = self.puts = 0
+    self.skipped = 0
+    CACHES[name] = self
+
+  # NB: ident (from cache_ident) avoids a stat per key
+  def _key(self, file, key, ident = None):
+    fi = cache_ident(file) if ident is None else ident
+    return repr((self.name, self.version, fi, key))
+
+  def get(self, file, key, ident = None):
+    k = self._key(file, key, ident)
+    with self.lock:
+      if k in self.data:
+        self.hits += 1
+        self.data.move_to_end(k)
+        return self.data[k]
+    v = self._get_shared(k) if self.shared else None
+    with self.lock:
+      if v is None:
+        self.misses += 1
+      else:
+        self.shared_hits += 1
+        self._put(k, v)
+    return v
+
+  def put(self, file, key, value, ident = None):
+    if len(value) > CACHE_ITEM_MAX:
+      with self.lock: self.skipped += 1
+      return
+    k = self._key(file, key, ident)
+    with self.lock: self._put(k, value)
+    if self.shared: self._put_shared(k, value)
+
+  def _put(self, k, v):
+    self.data[k] = v
+    self.data.move_to_end(k)
+    while len(self.data) > self.size: self.data.popitem(last = False)
+
+  def _conn(self):
+    if getattr(self.local, "pid", None) != os.getpid():
+      self.local.conn = sqlite3.connect(self.shared, timeout = 1)
+      self.local.conn.executescript(CACHE_SQL)
+      self.local.pid  = os.getpid()
+    return self.local.conn
+
+  # NB: the shared cache is best effort
+  def _get_shared(self, k):
+    try:
+      with self._conn() as conn:
+        r = conn.execute("SELECT value FROM cache WHERE key = ?",
+                         (k,)).fetchone()
+        if r is None: return None
+        conn.execute("UPDATE cache SET used = strftime('%s') " +
+                     "WHERE key = ?", (k,))
+      return json.loads(r[0])
+    except sqlite3.Error:
+      return None
+
+  def _put_shared(self, k, v):
+    try:
+      with self._conn() as conn:
+        conn.execute("INSERT OR REPLACE INTO cache VALUES " +
+                     "(?, ?, strftime('%s'))", (k, json.dumps(v)))
+        self.puts += 1
+        if self.puts % 256 == 0:
+          conn.execute("""
+            DELETE FROM cache WHERE key IN (
+              SELECT key FROM cache ORDER BY used DESC
+              LIMIT -1 OFFSET ?
+            )
+          """, (CACHE_MAX,))
+    except sqlite3.Error:
+      pass
+
+  def stats(self):
+    return dict(hits = self.hits, misses = self.misses,
+                shared_hits = self.shared_hits, size = len(self.data),
+                skipped = self.skipped)
+                                                                # }}}1
+
+# NB: False (not None, which means "stat it") for a missing file
+def cache_ident(file):
+  try:
+    st = os.stat(file)
+  except OSError:
+    return False
+  return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def cache_stats():
+  return { name: c.stats() for name, c in CACHES.items() }
+
+# NB: a dense numbering (1..n) of the keys of table, so random_keys
+# can pick a random row w/ a single O(log n) lookup; uses execute (not
+# executescript, which would COMMIT) so it can be part of a larger
+# transaction
+def sample2sqldb(c, table, key):
+  t, k = table, key
+  c.execute(f"DROP TABLE IF EXISTS {t}_sample")                # safe!
+  c.execute(f"""
+    CREATE TABLE {t}_sample(
+      n INTEGER PRIMARY KEY ASC,
+      key INTEGER
+    )""")                                                       # safe!
+  c.execute(f"""
+    INSERT INTO {t}_sample (key) SELECT {k} FROM {t} ORDER BY {k}
+  """)                                                          # safe!
+
+# NB: rejection sampling: random rows are kept if they match cond
+# (e.g. "AND jlpt = :jlpt"); at most tries + limit lookups are made in
+# total, fewer once the hit rate (after SAMPLE_PROBE lookups) shows the
+# remaining keys are unlikely to be found within that budget (i.e. for
+# very selective filters); what remains is selected using ORDER BY
+# RANDOM(), as is everything w/o a limit or a sample table
+def random_keys(c, table, key, cond = "", params = None, limit = 1,
+                tries = SAMPLE_TRIES):
+  keys, sample, params = [], table + "_sample", params or {}
+  if limit and have_table(c, sample):
+    hi = c.execute(f"SELECT MAX(n) FROM {sample}").fetchone()[0]
+    q  = f"""SELECT {key} FROM {table} WHERE {key} =
+               (SELECT key FROM {sample} WHERE n = :sample_n) {cond}
+          """                                                   # safe!
+    n, hits, budget = 0, 0, tries + limit if hi else 0
+    while n < budget:
+      n += 1
+      ps = dict(params, sample_n = random.randint(1, hi))
+      if r := c.execute(q, ps).fetchone():
+        hits += 1
+        if r[0] not in keys:
+          keys.append(r[0])
+          if len(keys) == limit: return keys
+      if n >= SAMPLE_PROBE and \
+         (limit - len(keys)) * n > (budget - n) * hits: break
+  ks    = ",".join(map(str, keys))
+  skip  = f"AND {key} NOT IN ({ks})" if keys else ""
+  lim   = f"LIMIT {int(limit) - len(keys)}" if limit else ""
+  q     = f"""SELECT {key} FROM {table} WHERE 1=1 {cond} {skip}
+                ORDER BY RANDOM() {lim}"""                      # safe!
+  return keys + [ r[0] for r in c.execute(q, params) ]
+
+# NB: trigram tokenizer requires sqlite >= 3.34.0
+def have_fts5(conn):
+  if sqlite3.sqlite_version_info < (3, 34, 0): return False
+  q = "SELECT sqlite_compileoption_used('ENABLE_FTS5')"
+  return bool(conn.execute(q).fetchone()[0])
+
+def have_table(conn, name):
+  q = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?"
+  return conn.execute(q, (name,)).fetchone() is not None
 
 def load_pcre_extension(conn):
+  if conn.pcre: return
   spec = importlib.util.find_spec("jiten._sqlite3_pcre")
   if spec is None: raise RuntimeError("jiten._sqlite3_pcre not found")
   conn.enable_load_extension(True)
@@ -53,5 +373,12 @@ def load_pcre_extension(conn):
   else:
     conn.execute("SELECT load_extension(?)", (spec.origin,))
   conn.enable_load_extension(False)
+  conn.pcre = True
+
+if __name__ == "__main__":
+  if "--doctest" in sys.argv:
+    verbose = "--verbose" in sys.argv
+    import doctest
+    if doctest.testmod(verbose = verbose)[0]: sys.exit(1)
 
 # vim: set tw=70 sw=2 sts=2 et fdm=marker :
@@ -382,6 +382,29 @@ $(":checkbox[data-command]").change(evt => {
   i.val(x + v.replace(/^\+[=1w]\s*/, ""))
 })
 
+// === completion ===
+
+// NB: responses to earlier (slower) requests are ignored
+$("#jmdict-query").each((_i, e) => {
+  const list = $('<datalist id="jmdict-completions"></datalist>')
+  let timer = null, req = 0
+  $(e).attr("list", "jmdict-completions").after(list)
+  $(e).on("input", () => {
+    clearTimeout(timer)
+    timer = setTimeout(() => {
+      const q = e.value.trim(), n = ++req
+      if (!q || q.startsWith("+")) { list.empty(); return }
+      fetch("/_complete?q=" + encodeURIComponent(q))
+        .then(r => r.ok ? r.json() : [])
+        .then(ws => {
+          if (n != req) { return }
+          list.empty().append(ws.map(w => $("<option>").val(w)))
+        })
+        .catch(e => console.error("completion failed:", e))
+    }, 100)
+  })
+})
+
 if (copyToClipboard) {
   $(".copy-input").click(e => {
     const i = $("input[type=text]", $(e.delegateTarget).parents(".input-group"))
@@ -454,6 +477,30 @@ const chooseRadicals = (elems, toggle = true) => {
     $(e)[((toggle ? !inc : inc) ? "add" : "remove") + "Class"]("chosen")
   })
   if (toggle) { q.val("+r " + rs.join("")) }
+  radicalCandidates(rs)
+}
+
+// NB: dims the radicals that would leave no results & lists the
+// kanji containing all chosen radicals
+let radicalsReq = 0
+const radicalCandidates = rs => {
+  const n = ++radicalsReq, list = $("#radical-candidates")
+  fetch("/_radicals?q=" + encodeURIComponent(rs.join("")))
+    .then(r => r.ok ? r.json() : null)
+    .then(d => {
+      if (!d || n != radicalsReq) { return }
+      $(".radical").each((i, e) => {
+        const r = e.innerText.trim()
+        $(e).toggleClass("unavailable",
+                         !rs.includes(r) && !d.radicals.includes(r))
+      })
+      list.empty().append([...d.kanji].map(k =>
+        $("<a>").attr("href", "/kanji?query=" + encodeURIComponent(k))
+                .text(k).addClass("mr-1")
+      ))
+      if (d.count > [...d.kanji].length) { list.append("…") }
+    })
+    .catch(e => console.error("radical candidates failed:", e))
 }
 
 $(".radical").click(e => chooseRadicals($(e.delegateTarget)))
@@ -97,6 +97,7 @@ setuptools.setup(
   ),
   python_requires   = ">=3.8",
   install_requires  = ["Flask", "click>=6.0", "kanjidraw>=0.2.1"],
-  extras_require    = dict(gui = ["pywebview>=3.3.5"]),
+  extras_require    = dict(gui = ["pywebview>=3.3.5"],
+                           brotli = ["Brotli"]),
   ext_modules       = [pcre],
 )